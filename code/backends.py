@@ -0,0 +1,299 @@
+import hashlib
+import time
+
+import config
+
+
+class InterviewerBackend:
+    """Interface of the language model backends that generate interviewer messages.
+
+    A backend is created once per process and shared by all sessions, so that API
+    clients and their HTTP connection pools are reused across turns. Messages use
+    the interview's own format ({"role": ..., "content": ...}), which each backend
+    converts to its API.
+    """
+
+    api = None
+
+    def __init__(self, model, system_prompt):
+        self.model = model
+        self.system_prompt = system_prompt
+
+    def is_streaming(self, conversation_state=None):
+        """Whether the replies of an interview are currently streamed token by token."""
+        return True
+
+    def opening_messages(self):
+        """Return the messages that start a new interview's history."""
+        return [{"role": "system", "content": self.system_prompt}]
+
+    def stream_reply(self, messages, usage=None, conversation_state=None):
+        """Yield the text deltas of the interviewer's reply to the messages.
+
+        If a usage dict is passed, it is filled with the token counts of the request
+        once the reply is complete (input_tokens, cached_input_tokens,
+        cache_creation_input_tokens and output_tokens, where reported).
+        conversation_state is a dict kept per interview in which a backend can
+        store provider-side conversation state between turns.
+        """
+        raise NotImplementedError
+
+
+class OpenAIBackend(InterviewerBackend):
+    """OpenAI Responses API, streamed if the organization is allowed to."""
+
+    api = "openai"
+
+    def __init__(self, model, system_prompt, api_key):
+        super().__init__(model, system_prompt)
+        import openai
+
+        self._openai = openai
+        self.client = openai.OpenAI(api_key=api_key)
+        # Requests of all interviews share the system prompt as their prefix; a common
+        # cache key routes them to the same prompt cache
+        self.prompt_cache_key = (
+            "interview-" + hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:16]
+        )
+
+    def is_streaming(self, conversation_state=None):
+        return config.OPENAI_STREAMING and not (conversation_state or {}).get(
+            "streaming_rejected"
+        )
+
+    @staticmethod
+    def is_streaming_rejection(error):
+        """Whether an API error rejects streaming itself (e.g. before organization
+        verification), rather than the request."""
+        return getattr(error, "param", None) == "stream"
+
+    def build_kwargs(self, messages, conversation_state=None):
+        """Return the Responses API arguments for a reply to the messages.
+
+        If the conversation state holds the ID of a stored previous response that
+        covers the beginning of the messages, the request continues that response
+        and only contains the new messages.
+        """
+        previous_response_id = None
+        if conversation_state and conversation_state.get("previous_response_id"):
+            covered = conversation_state["previous_message_count"]
+            if covered <= len(messages):
+                previous_response_id = conversation_state["previous_response_id"]
+                messages = messages[covered:]
+
+        # Convert messages for Responses API: change 'system' role to 'developer'
+        input_messages = []
+        for msg in messages:
+            if msg["role"] == "system":
+                input_messages.append({"role": "developer", "content": msg["content"]})
+            else:
+                input_messages.append({"role": msg["role"], "content": msg["content"]})
+        api_kwargs = {
+            "model": self.model,
+            "input": input_messages,
+            "reasoning": {"effort": config.REASONING_EFFORT},
+            # Responses API uses max_output_tokens instead of max_tokens
+            "max_output_tokens": config.MAX_OUTPUT_TOKENS,
+        }
+        if config.TEMPERATURE is not None:
+            api_kwargs["temperature"] = config.TEMPERATURE
+        if config.PROMPT_CACHING:
+            api_kwargs["prompt_cache_key"] = self.prompt_cache_key
+        if config.OPENAI_CHAIN_RESPONSES:
+            api_kwargs["store"] = True
+            if previous_response_id:
+                api_kwargs["previous_response_id"] = previous_response_id
+        return api_kwargs
+
+    def create_response(self, messages, conversation_state, stream):
+        """Send a Responses API request, replaying the full history if the stored
+        previous response has expired or been deleted on the server."""
+        api_kwargs = self.build_kwargs(messages, conversation_state)
+        try:
+            return self.client.responses.create(**api_kwargs, stream=stream)
+        except (self._openai.NotFoundError, self._openai.BadRequestError) as e:
+            if "previous_response_id" not in api_kwargs or not (
+                isinstance(e, self._openai.NotFoundError)
+                or getattr(e, "param", None) == "previous_response_id"
+            ):
+                raise
+        conversation_state.pop("previous_response_id", None)
+        conversation_state.pop("previous_message_count", None)
+        return self.client.responses.create(**self.build_kwargs(messages), stream=stream)
+
+    @staticmethod
+    def record_response(response, messages, conversation_state):
+        """Remember a completed response so the next turn can continue it."""
+        if config.OPENAI_CHAIN_RESPONSES and conversation_state is not None:
+            conversation_state["previous_response_id"] = response.id
+            # The messages plus the reply, which is appended to the history
+            conversation_state["previous_message_count"] = len(messages) + 1
+
+    @staticmethod
+    def record_usage(response_usage, usage):
+        """Copy the token counts of a Responses API usage object into usage."""
+        if usage is None or response_usage is None:
+            return
+        usage["input_tokens"] = response_usage.input_tokens
+        usage["output_tokens"] = response_usage.output_tokens
+        if response_usage.input_tokens_details is not None:
+            usage["cached_input_tokens"] = response_usage.input_tokens_details.cached_tokens
+
+    def stream_reply(self, messages, usage=None, conversation_state=None):
+        """Yield the text deltas of a Responses API reply.
+
+        Falls back to a non-streaming request (yielding the whole text at once) if
+        the API rejects streaming, e.g. for organizations that are not verified yet,
+        and remembers this in the interview's conversation state. Other errors are
+        raised.
+        """
+        if self.is_streaming(conversation_state):
+            try:
+                stream = self.create_response(messages, conversation_state, stream=True)
+            except (self._openai.BadRequestError, self._openai.PermissionDeniedError) as e:
+                if not self.is_streaming_rejection(e):
+                    raise
+                if conversation_state is not None:
+                    conversation_state["streaming_rejected"] = True
+            else:
+                with stream:
+                    for event in stream:
+                        if event.type == "response.output_text.delta":
+                            yield event.delta
+                        elif event.type == "response.completed":
+                            self.record_usage(event.response.usage, usage)
+                            self.record_response(event.response, messages, conversation_state)
+                return
+
+        response = self.create_response(messages, conversation_state, stream=False)
+        self.record_usage(response.usage, usage)
+        self.record_response(response, messages, conversation_state)
+        # Extract text from non-streaming response
+        message = ""
+        for item in response.output:
+            if hasattr(item, "content") and item.content is not None:
+                for content in item.content:
+                    if hasattr(content, "text"):
+                        message += content.text
+        yield message
+
+
+class AnthropicBackend(InterviewerBackend):
+    """Anthropic Messages API with streaming."""
+
+    api = "anthropic"
+
+    def __init__(self, model, system_prompt, api_key):
+        super().__init__(model, system_prompt)
+        import anthropic
+
+        self.client = anthropic.Anthropic(api_key=api_key)
+
+    def opening_messages(self):
+        # The system prompt is passed separately, and a conversation has to start
+        # with a user message
+        return [{"role": "user", "content": "Hi"}]
+
+    def build_kwargs(self, messages):
+        """Return the Messages API arguments for a reply to the messages.
+
+        With prompt caching, cache breakpoints are set on the system prompt and on
+        the last message, so that the next turn reads the whole previous
+        conversation from the cache and only the new messages are processed.
+        """
+        conversation = [
+            {"role": msg["role"], "content": msg["content"]}
+            for msg in messages
+            if msg["role"] != "system"
+        ]
+        system = self.system_prompt
+        if config.PROMPT_CACHING:
+            system = [
+                {"type": "text", "text": self.system_prompt, "cache_control": {"type": "ephemeral"}}
+            ]
+            if conversation:
+                conversation[-1]["content"] = [
+                    {
+                        "type": "text",
+                        "text": conversation[-1]["content"],
+                        "cache_control": {"type": "ephemeral"},
+                    }
+                ]
+        api_kwargs = {
+            "model": self.model,
+            "system": system,
+            "messages": conversation,
+            "max_tokens": config.MAX_OUTPUT_TOKENS,
+        }
+        if config.TEMPERATURE is not None:
+            api_kwargs["temperature"] = config.TEMPERATURE
+        return api_kwargs
+
+    def stream_reply(self, messages, usage=None, conversation_state=None):
+        with self.client.messages.stream(**self.build_kwargs(messages)) as stream:
+            for text_delta in stream.text_stream:
+                if text_delta != None:
+                    yield text_delta
+            if usage is not None:
+                message_usage = stream.get_final_message().usage
+                usage["input_tokens"] = message_usage.input_tokens
+                usage["output_tokens"] = message_usage.output_tokens
+                usage["cached_input_tokens"] = message_usage.cache_read_input_tokens
+                usage["cache_creation_input_tokens"] = message_usage.cache_creation_input_tokens
+
+
+class FakeBackend(InterviewerBackend):
+    """Offline stand-in that streams canned questions, to try the interface without
+    an API key. After `turns` questions it ends the interview with the closing code.
+    """
+
+    api = "fake"
+
+    QUESTIONS = [
+        "Hello! I'm glad to have the opportunity to speak with you today. Could you start off by telling me about what you do for work?",
+        "Thank you. Can you tell me more about the last time you did that?",
+        "What went through your mind in that moment?",
+        "Why is this important to you?",
+        "Can you offer an example?",
+    ]
+
+    def __init__(
+        self,
+        model,
+        system_prompt,
+        latency=config.FAKE_BACKEND_LATENCY_SECONDS,
+        tokens_per_second=config.FAKE_BACKEND_TOKENS_PER_SECOND,
+        turns=config.FAKE_BACKEND_TURNS,
+    ):
+        super().__init__(model, system_prompt)
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.turns = turns
+
+    def stream_reply(self, messages, usage=None, conversation_state=None):
+        turn = sum(1 for msg in messages if msg["role"] == "assistant")
+        if turn < self.turns:
+            reply = self.QUESTIONS[turn % len(self.QUESTIONS)]
+        else:
+            reply = "Thank you very much for your answers! Your code is FAKE1234. x7y8"
+
+        time.sleep(self.latency)
+        words = reply.split(" ")
+        for i, word in enumerate(words):
+            if i > 0 and self.tokens_per_second:
+                time.sleep(1 / self.tokens_per_second)
+            yield word if i == len(words) - 1 else word + " "
+
+
+def create_backend(model, system_prompt, api_keys):
+    """Create the backend for a model name; api_keys maps secret names to keys."""
+
+    if model.lower() == "fake":
+        return FakeBackend(model, system_prompt)
+    if "gpt" in model.lower():
+        return OpenAIBackend(model, system_prompt, api_keys["API_KEY_OPENAI"])
+    if "claude" in model.lower():
+        return AnthropicBackend(model, system_prompt, api_keys["API_KEY_ANTHROPIC"])
+    raise ValueError(
+        "Model does not contain 'gpt' or 'claude' and is not 'fake'; unable to determine API."
+    )
@@ -0,0 +1,491 @@
+import argparse
+import os
+import statistics
+import time
+
+import bson
+from pymongo import MongoClient
+
+import database
+from utils import build_interview_update
+
+
+def print_latencies(label, latencies):
+    """Print summary statistics of a list of latencies in seconds."""
+    latencies_ms = sorted(1000 * latency for latency in latencies)
+    p95 = latencies_ms[int(0.95 * (len(latencies_ms) - 1))]
+    print(
+        f"  {label:<28} mean {statistics.mean(latencies_ms):8.2f} ms   "
+        f"median {statistics.median(latencies_ms):8.2f} ms   p95 {p95:8.2f} ms"
+    )
+
+
+def make_turn_update(turn):
+    """Build an update document resembling the per-turn interview upsert."""
+    transcript = [
+        {"role": "assistant" if i % 2 == 0 else "user", "content": "x" * 400}
+        for i in range(turn + 1)
+    ]
+    return {
+        "$set": {"last_updated_unix": time.time(), "transcript": transcript},
+        "$setOnInsert": {"username": "benchmark", "start_time_unix": 0.0},
+    }
+
+
+def benchmark_pooling(args):
+    """Compare per-turn save latency with a pooled client and a client per turn."""
+
+    if args.mongomock:
+        import mongomock
+
+        client_factory = mongomock.MongoClient
+        database._clients[args.mongo_uri] = client_factory(args.mongo_uri)
+    else:
+        client_factory = MongoClient
+
+    query = {"username": "benchmark", "start_time_unix": 0.0}
+
+    # Baseline: connect, upsert and close on every turn
+    unpooled = []
+    for turn in range(args.turns):
+        started = time.perf_counter()
+        client = client_factory(args.mongo_uri)
+        client[args.db][args.collection].update_one(
+            query, make_turn_update(turn), upsert=True
+        )
+        client.close()
+        unpooled.append(time.perf_counter() - started)
+
+    # Pooled: reuse the process-wide client
+    collection = database.get_collection(
+        {"uri": args.mongo_uri, "db": args.db, "collection": args.collection}
+    )
+    pooled = []
+    for turn in range(args.turns):
+        started = time.perf_counter()
+        collection.update_one(query, make_turn_update(turn), upsert=True)
+        pooled.append(time.perf_counter() - started)
+
+    collection.delete_many(query)
+    database.close_clients()
+
+    print(f"\nPer-turn save latency over {args.turns} turns ({args.mongo_uri}):")
+    print_latencies("new client per turn", unpooled)
+    print_latencies("pooled client", pooled)
+
+
+def make_turn_metrics(turn):
+    """Build turn metrics resembling those recorded by metrics.TurnTimer."""
+    events = [
+        "request_sent",
+        "first_token",
+        "last_token",
+        "render_complete",
+        "backup_written",
+        "database_written",
+    ]
+    return {
+        "turn": turn,
+        "api": "openai",
+        "offsets": {event: 0.123456 * (i + 1) for i, event in enumerate(events)},
+        "time_to_first_token_seconds": 0.654321,
+        "response_seconds": 2.345678,
+        "streamed": True,
+        "input_tokens": 5000,
+        "cached_input_tokens": 4096,
+        "output_tokens": 80,
+        "backup_seconds": 0.001234,
+        "database_seconds": 0.012345,
+    }
+
+
+def benchmark_transcript_bytes(args):
+    """Compare bytes sent per turn for full transcript rewrites and $push updates
+    (including the turn metrics stored with the interview)."""
+
+    print("\nMongoDB update size per turn (BSON bytes of the update document):")
+    for turns in args.turns:
+        messages = [{"role": "system", "content": "system prompt"}]
+        turn_metrics = []
+        full_sizes, incremental_sizes = [], []
+        persisted_count, persisted_turns = 0, 0
+        for turn in range(turns):
+            messages.append({"role": "user", "content": "r" * args.message_length})
+            messages.append({"role": "assistant", "content": "a" * args.message_length})
+            turn_metrics.append(make_turn_metrics(turn + 1))
+            snapshot = {
+                "username": "benchmark",
+                "system_prompt": "system prompt",
+                "messages": messages,
+                "start_time": 0.0,
+                "interview_active": True,
+                "turn_metrics": turn_metrics,
+                "saved_at": time.time(),
+            }
+            query, update, upsert = build_interview_update(snapshot)
+            full_sizes.append(len(bson.encode(query)) + len(bson.encode(update)))
+            query, update, upsert = build_interview_update(
+                snapshot, persisted_count, None, persisted_turns
+            )
+            incremental_sizes.append(len(bson.encode(query)) + len(bson.encode(update)))
+            persisted_count = update["$set"]["message_count"]
+            persisted_turns = len(turn_metrics)
+
+        print(
+            f"  {turns:>4} turns: full rewrite {statistics.mean(full_sizes):>10,.0f} B/turn "
+            f"({sum(full_sizes):>12,} B total)   incremental "
+            f"{statistics.mean(incremental_sizes):>8,.0f} B/turn "
+            f"({sum(incremental_sizes):>10,} B total)"
+        )
+
+
+def benchmark_time_to_first_token(args):
+    """Measure time to first token of the configured models with and without streaming."""
+
+    import toml
+
+    import config
+
+    secrets = toml.load(os.path.join(os.path.dirname(__file__), ".streamlit", "secrets.toml"))
+    messages = [{"role": "user", "content": "Hi"}]
+
+    def measure(label, request):
+        first_tokens, totals = [], []
+        for _ in range(args.requests):
+            started = time.perf_counter()
+            first_token = None
+            for text_delta in request():
+                if first_token is None and text_delta:
+                    first_token = time.perf_counter()
+            totals.append(time.perf_counter() - started)
+            first_tokens.append((first_token or time.perf_counter()) - started)
+        print_latencies(f"{label} first token", first_tokens)
+        print_latencies(f"{label} complete", totals)
+
+    print(f"\nTime to first token over {args.requests} requests:")
+
+    if "API_KEY_OPENAI" in secrets:
+        from openai import OpenAI
+
+        client = OpenAI(api_key=secrets["API_KEY_OPENAI"])
+        model = args.openai_model
+        kwargs = dict(
+            model=model,
+            input=[{"role": "developer", "content": config.SYSTEM_PROMPT}] + messages,
+            max_output_tokens=config.MAX_OUTPUT_TOKENS,
+            reasoning={"effort": config.REASONING_EFFORT},
+        )
+
+        def openai_streaming():
+            with client.responses.create(**kwargs, stream=True) as stream:
+                for event in stream:
+                    if event.type == "response.output_text.delta":
+                        yield event.delta
+
+        def openai_non_streaming():
+            yield client.responses.create(**kwargs, stream=False).output_text
+
+        measure(f"{model} streaming", openai_streaming)
+        measure(f"{model} non-streaming", openai_non_streaming)
+
+    if "API_KEY_ANTHROPIC" in secrets:
+        import anthropic
+
+        client = anthropic.Anthropic(api_key=secrets["API_KEY_ANTHROPIC"])
+        model = args.anthropic_model
+        kwargs = dict(
+            model=model,
+            system=config.SYSTEM_PROMPT,
+            messages=messages,
+            max_tokens=config.MAX_OUTPUT_TOKENS,
+        )
+
+        def anthropic_streaming():
+            with client.messages.stream(**kwargs) as stream:
+                yield from stream.text_stream
+
+        measure(f"{model} streaming", anthropic_streaming)
+
+
+def get_plan_stages(plan):
+    """Return the stage names of a query plan, from the root to the leaves."""
+    stages = []
+    while plan:
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        # Slot-based execution nests the classic plan under queryPlan
+        plan = plan.get("queryPlan") or plan.get("inputStage") or (
+            plan.get("inputStages") or [None]
+        )[0]
+    return stages
+
+
+def is_interviews_collection(args):
+    """Return whether --db and --collection name the interviews collection of the
+    app's MongoDB secrets (if any)."""
+
+    import toml
+
+    try:
+        mongo_secrets = toml.load(
+            os.path.join(os.path.dirname(__file__), ".streamlit", "secrets.toml")
+        )["mongo"]
+    except (OSError, KeyError, toml.TomlDecodeError):
+        return False
+    return (args.db, args.collection) == (
+        mongo_secrets.get("db"),
+        mongo_secrets.get("collection"),
+    )
+
+
+def benchmark_indexes(args):
+    """Show with explain() which interview queries use an index, before and after
+    ensure_indexes()."""
+
+    if args.mongomock:
+        raise SystemExit("explain() needs a MongoDB server; run without --mongomock.")
+    if is_interviews_collection(args):
+        raise SystemExit(
+            f"{args.db}.{args.collection} is the interviews collection in secrets.toml; "
+            "use a scratch collection."
+        )
+    if not args.yes:
+        raise SystemExit(
+            f"This benchmark drops {args.db}.{args.collection} on {args.mongo_uri}; "
+            "pass --yes if it is a scratch collection."
+        )
+
+    collection = database.get_collection(
+        {"uri": args.mongo_uri, "db": args.db, "collection": args.collection}
+    )
+    collection.drop()
+    now = time.time()
+    collection.insert_many(
+        [
+            {
+                "username": f"respondent{i}",
+                "start_time_unix": now - 60 * i,
+                "last_updated_unix": now - 60 * i + 600,
+                "duration_minutes": round((i % 30) + 0.5, 2),
+                "message_count": 2,
+                "transcript": [{"role": "assistant", "content": "x" * 400}] * 2,
+            }
+            for i in range(args.documents)
+        ]
+    )
+
+    middle = args.documents // 2
+    queries = {
+        "per-turn upsert filter": lambda: collection.find(
+            {"username": f"respondent{middle}", "start_time_unix": now - 60 * middle}
+        ),
+        "newest 50 interviews": lambda: collection.find({}, {"transcript": 0})
+        .sort("start_time_unix", -1)
+        .limit(50),
+        "duration >= 8 minutes": lambda: collection.find(
+            {"duration_minutes": {"$gte": 8}}, {"_id": 1}
+        ),
+        "resume unfinished interview": lambda: database.find_unfinished_interview(
+            collection, f"respondent{middle}", now - 86400
+        ),
+        "changed since (incremental)": lambda: collection.find(
+            {"last_updated_unix": {"$gt": now}}
+        ).sort([("last_updated_unix", 1), ("_id", 1)]),
+    }
+
+    def report(label):
+        print(f"\nQuery plans {label} ({args.documents} interviews):")
+        for name, query in queries.items():
+            explain = query().explain()
+            stats = explain["executionStats"]
+            stages = get_plan_stages(explain["queryPlanner"]["winningPlan"])
+            print(
+                f"  {name:<28} {' <- '.join(stages):<32} keys examined "
+                f"{stats['totalKeysExamined']:>7}   documents examined "
+                f"{stats['totalDocsExamined']:>7}   {stats['executionTimeMillis']:>4} ms"
+            )
+
+    report("without indexes")
+    database.ensure_indexes(collection)
+    report("with ensure_indexes()")
+
+    collection.drop()
+    database.close_clients()
+
+
+def benchmark_rerun(args):
+    """Measure the execution time of full interview.py reruns against the length
+    of the history, with and without the per-process bootstrap cache (prompt
+    assembly, token count, code matcher and directories).
+
+    AppTest always reruns the whole page. In the server, answers only rerun the
+    live-turn fragment, whose cost does not depend on the history; full reruns
+    remain for page loads and the 'Quit' button.
+    """
+
+    import tempfile
+
+    import config
+
+    # Offline interview in a temporary directory; must be set before the app's
+    # modules are imported by the first run
+    directory = tempfile.mkdtemp(prefix="interview_rerun_benchmark_")
+    history_lengths = sorted(args.messages)
+    config.MODEL = "fake"
+    config.FAKE_BACKEND_LATENCY_SECONDS = 0
+    config.FAKE_BACKEND_TOKENS_PER_SECOND = 0
+    config.FAKE_BACKEND_TURNS = history_lengths[-1] + 1
+    config.PERSISTENCE_DEAD_LETTER_FILE = os.path.join(directory, "unsaved_snapshots.jsonl")
+    for setting in ["TRANSCRIPTS_DIRECTORY", "TIMES_DIRECTORY", "BACKUPS_DIRECTORY"]:
+        setattr(config, setting, os.path.join(directory, setting.lower()) + "/")
+
+    from streamlit.testing.v1 import AppTest
+
+    import bootstrap
+
+    app = AppTest.from_file(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "interview.py"),
+        default_timeout=60,
+    )
+    app.secrets["passwords"] = {"PASSWORD": "benchmark"}
+    app.query_params["username"] = "benchmark"
+    app.query_params["password"] = "benchmark"
+    app.run()
+
+    def measure(clear_bootstrap):
+        durations = []
+        for _ in range(args.reruns):
+            if clear_bootstrap:
+                bootstrap.get_interview.clear()
+            started = time.perf_counter()
+            app.run()
+            durations.append(time.perf_counter() - started)
+        return durations
+
+    answers = 0
+    for history_length in history_lengths:
+        # Grow the same interview to the next history length
+        while answers < history_length:
+            app.chat_input[0].set_value(f"Answer {answers}").run()
+            answers += 1
+
+        print(
+            f"\nRerun of interview.py with {history_length} answers in the history "
+            f"({len(app.chat_message)} displayed messages, {args.reruns} reruns):"
+        )
+        print_latencies("setup on every rerun", measure(clear_bootstrap=True))
+        print_latencies("bootstrap cached", measure(clear_bootstrap=False))
+
+
+def benchmark_closing_codes(args):
+    """Compare rescanning the accumulated reply for codes with the streaming matcher."""
+
+    import random
+
+    import config
+    from streaming import ClosingCodeMatcher
+
+    codes = list(config.CLOSING_MESSAGES.keys())
+    random.seed(0)
+    words = ["interview", "work", "tell", "me", "more", "about", "that", "x7", "5j"]
+
+    print("\nClosing-code detection per reply (deltas of ~4 characters, code at the end):")
+    for length in args.lengths:
+        text = ""
+        while len(text) < length:
+            text += random.choice(words) + " "
+        text += codes[-1]
+        deltas = [text[i : i + 4] for i in range(0, len(text), 4)]
+
+        started = time.perf_counter()
+        accumulated = ""
+        for delta in deltas:
+            accumulated += delta
+            if any(code in accumulated for code in codes):
+                break
+        naive = time.perf_counter() - started
+
+        started = time.perf_counter()
+        matcher = ClosingCodeMatcher(codes)
+        for delta in deltas:
+            if matcher.feed(delta):
+                break
+        streaming = time.perf_counter() - started
+
+        print(
+            f"  {len(text):>7,} characters: rescan {1000 * naive:9.2f} ms   "
+            f"streaming matcher {1000 * streaming:7.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Micro-benchmarks for the interview platform.",
+    )
+    parser.add_argument(
+        "--mongo-uri",
+        default="mongodb://localhost:27017",
+        help="MongoDB to benchmark against (default: local mongod)",
+    )
+    parser.add_argument("--db", default="benchmark", help="Database name")
+    parser.add_argument("--collection", default="interviews", help="Collection name")
+    parser.add_argument(
+        "--mongomock",
+        action="store_true",
+        help="Use an in-memory mongomock stand-in instead of a server",
+    )
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    pooling_parser = subparsers.add_parser(
+        "pooling", help="Per-turn save latency with and without connection pooling"
+    )
+    pooling_parser.add_argument("--turns", type=int, default=50)
+    pooling_parser.set_defaults(func=benchmark_pooling)
+
+    transcript_bytes_parser = subparsers.add_parser(
+        "transcript-bytes",
+        help="Bytes sent per turn with full rewrites and incremental $push updates",
+    )
+    transcript_bytes_parser.add_argument(
+        "--turns", type=int, nargs="+", default=[10, 50, 200]
+    )
+    transcript_bytes_parser.add_argument("--message-length", type=int, default=400)
+    transcript_bytes_parser.set_defaults(func=benchmark_transcript_bytes)
+
+    ttft_parser = subparsers.add_parser(
+        "ttft",
+        help="Time to first token of the OpenAI and Anthropic APIs (needs API keys in secrets.toml)",
+    )
+    ttft_parser.add_argument("--requests", type=int, default=5)
+    ttft_parser.add_argument("--openai-model", default="gpt-5")
+    ttft_parser.add_argument("--anthropic-model", default="claude-3-5-sonnet-20240620")
+    ttft_parser.set_defaults(func=benchmark_time_to_first_token)
+
+    indexes_parser = subparsers.add_parser(
+        "indexes", help="explain() of the interview queries with and without indexes"
+    )
+    indexes_parser.add_argument("--documents", type=int, default=10000)
+    indexes_parser.add_argument(
+        "--yes",
+        action="store_true",
+        help="Confirm that --db/--collection is a scratch collection; it is dropped",
+    )
+    indexes_parser.set_defaults(func=benchmark_indexes)
+
+    rerun_parser = subparsers.add_parser(
+        "rerun", help="Script execution time of interview.py reruns (offline fake model)"
+    )
+    rerun_parser.add_argument("--reruns", type=int, default=50)
+    rerun_parser.add_argument("--messages", type=int, nargs="+", default=[10, 50, 200])
+    rerun_parser.set_defaults(func=benchmark_rerun)
+
+    closing_codes_parser = subparsers.add_parser(
+        "closing-codes", help="Closing-code detection on long synthetic streamed replies"
+    )
+    closing_codes_parser.add_argument(
+        "--lengths", type=int, nargs="+", default=[1000, 10000, 100000]
+    )
+    closing_codes_parser.set_defaults(func=benchmark_closing_codes)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,112 @@
+import os
+
+import streamlit as st
+import toml
+
+import config
+from streaming import ClosingCodeMatcher
+
+
+# Settings of an interview that a config file in INTERVIEW_CONFIGS_DIRECTORY can
+# override; all other settings are shared by the process and stay in config.py
+INTERVIEW_SETTINGS = [
+    "INTERVIEW_OUTLINE",
+    "GENERAL_INSTRUCTIONS",
+    "CODES",
+    "CLOSING_MESSAGES",
+    "MODEL",
+    "TRANSCRIPTS_DIRECTORY",
+    "TIMES_DIRECTORY",
+    "BACKUPS_DIRECTORY",
+    "AVATAR_INTERVIEWER",
+    "AVATAR_RESPONDENT",
+]
+
+
+def assemble_system_prompt(interview_outline, general_instructions, codes):
+    """Assemble the system prompt from its parts, like config.SYSTEM_PROMPT."""
+    return f"""{interview_outline}
+
+
+{general_instructions}
+
+
+{codes}"""
+
+
+def count_tokens(text, model):
+    """Count the tokens of a text with tiktoken, or estimate them (~4 characters
+    per token) if it is not installed or does not know the model."""
+    try:
+        import tiktoken
+
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("o200k_base")
+        return len(encoding.encode(text))
+    except ImportError:
+        return round(len(text) / 4)
+
+
+def list_interview_configs():
+    """Return the names of the interview configs in INTERVIEW_CONFIGS_DIRECTORY."""
+    if not os.path.isdir(config.INTERVIEW_CONFIGS_DIRECTORY):
+        return []
+    return sorted(
+        os.path.splitext(file_name)[0]
+        for file_name in os.listdir(config.INTERVIEW_CONFIGS_DIRECTORY)
+        if file_name.endswith(".toml")
+    )
+
+
+def load_interview_settings(name=None):
+    """Return the interview settings of config.py, overridden by the config file
+    INTERVIEW_CONFIGS_DIRECTORY/<name>.toml if a name is given."""
+    settings = {setting: getattr(config, setting) for setting in INTERVIEW_SETTINGS}
+    if name:
+        overrides = toml.load(os.path.join(config.INTERVIEW_CONFIGS_DIRECTORY, f"{name}.toml"))
+        unknown = set(overrides) - set(INTERVIEW_SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown settings in interview config '{name}': {sorted(unknown)}")
+        settings.update(overrides)
+    return settings
+
+
+@st.cache_resource
+def get_interview(name=None):
+    """Prepare an interview config once per process.
+
+    Returns a dict with the assembled system prompt and its token count, the
+    closing messages, a compiled closing-code matcher (use matcher.copy() per
+    reply), the model, directories (created here) and avatars. Without a name,
+    the interview defined in config.py is used.
+    """
+    settings = load_interview_settings(name)
+    if name:
+        system_prompt = assemble_system_prompt(
+            settings["INTERVIEW_OUTLINE"], settings["GENERAL_INSTRUCTIONS"], settings["CODES"]
+        )
+    else:
+        system_prompt = config.SYSTEM_PROMPT
+
+    for directory in [
+        settings["TRANSCRIPTS_DIRECTORY"],
+        settings["TIMES_DIRECTORY"],
+        settings["BACKUPS_DIRECTORY"],
+    ]:
+        os.makedirs(directory, exist_ok=True)
+
+    return {
+        "name": name,
+        "system_prompt": system_prompt,
+        "prompt_tokens": count_tokens(system_prompt, settings["MODEL"]),
+        "closing_messages": dict(settings["CLOSING_MESSAGES"]),
+        "closing_code_matcher": ClosingCodeMatcher(settings["CLOSING_MESSAGES"].keys()),
+        "model": settings["MODEL"],
+        "transcripts_directory": settings["TRANSCRIPTS_DIRECTORY"],
+        "times_directory": settings["TIMES_DIRECTORY"],
+        "backups_directory": settings["BACKUPS_DIRECTORY"],
+        "avatar_interviewer": settings["AVATAR_INTERVIEWER"],
+        "avatar_respondent": settings["AVATAR_RESPONDENT"],
+    }
@@ -1,9 +1,10 @@
 import streamlit as st
-from pymongo import MongoClient
 import pandas as pd
 import time
 import config
 import hmac
+from bson import ObjectId
+import database
 
 # Set page config
 st.set_page_config(page_title="Transcript Browser", page_icon="📂", layout="wide")
@@ -28,32 +29,85 @@ except (KeyError, AttributeError):
 def get_mongo_collection():
     """Connects to MongoDB and returns the collection object."""
     try:
-        mongo_uri = st.secrets["mongo"]["uri"]
-        mongo_db = st.secrets["mongo"]["db"]
-        mongo_collection = st.secrets["mongo"]["collection"]
-        client = MongoClient(mongo_uri)
-        db = client[mongo_db]
-        return db[mongo_collection]
+        collection = database.get_collection(st.secrets["mongo"])
+        try:
+            database.ensure_indexes(collection)
+        except Exception:
+            pass  # e.g. database user without permission to create indexes
+        return collection
     except Exception as e:
         st.error(f"Failed to connect to MongoDB. Please check your secrets.toml file. Error: {e}")
         return None
 
 @st.cache_data
-def load_transcripts(_collection):
-    """Loads all transcripts from the collection and sorts them by start time."""
+def load_transcript_index(_collection):
+    """Loads a lightweight index of all transcripts (metadata and message count, but
+    no messages), sorted by start time on the server (newest first)."""
     if _collection is not None:
-        transcripts = list(_collection.find({}))
-        if transcripts:
-            # Sort by start_time_unix descending (newest first)
-            return sorted(transcripts, key=lambda x: x.get('start_time_unix', 0), reverse=True)
+        return list(
+            _collection.aggregate(
+                [
+                    {"$sort": {"start_time_unix": -1}},
+                    {
+                        "$project": {
+                            "_id": {"$toString": "$_id"},
+                            "username": 1,
+                            "start_time_unix": 1,
+                            "start_time_utc": 1,
+                            "duration_minutes": 1,
+                            "last_updated_unix": 1,
+                            "message_count": {
+                                "$ifNull": [
+                                    "$message_count",
+                                    {"$size": {"$ifNull": ["$transcript", []]}},
+                                ]
+                            },
+                        }
+                    },
+                ]
+            )
+        )
     return []
 
+
+@st.cache_data(max_entries=config.BROWSER_CACHED_TRANSCRIPTS)
+def load_transcript(_collection, transcript_id, last_updated_unix):
+    """Loads the full document of one transcript. The cache keeps the most recently
+    viewed documents; last_updated_unix makes updated transcripts load again."""
+    conversation = _collection.find_one({"_id": ObjectId(transcript_id)})
+    if conversation is not None:
+        conversation["_id"] = transcript_id
+    return conversation
+
+@st.cache_data
+def load_system_prompt(_collection, prompt_hash):
+    """Loads a system prompt from the prompt registry (prompts never change)."""
+    return database.resolve_prompt(_collection, prompt_hash)
+
+
+def format_transcript_for_download(conv):
+    lines = []
+    for key, value in conv.items():
+        if key != 'transcript' and key != '_id':
+            lines.append(f"{key.replace('_', ' ').title()}: {value}")
+    lines.append("\n---\nTranscript\n---")
+    for msg in conv.get("transcript", []):
+        lines.append(f"\n[{msg.get('role')}]\n{msg.get('content')}")
+    return "\n".join(lines)
+
+
+@st.cache_data(max_entries=config.BROWSER_CACHED_TRANSCRIPTS)
+def get_download_payload(transcript_id, last_updated_unix, _conversation):
+    """Builds the download text of a transcript once per document version."""
+    return format_transcript_for_download(_conversation)
+
+
 collection = get_mongo_collection()
 if collection is None:
     st.stop()
 
 # --- Main Application ---
-transcripts = load_transcripts(collection)
+transcripts = load_transcript_index(collection)
 
 if not transcripts:
     st.warning("No transcripts found in the database.")
@@ -117,8 +171,8 @@ with st.sidebar:
         
         c1, c2 = st.columns(2)
         if c1.button("✅ Yes, delete it", use_container_width=True, key="confirm_delete_button"):
-            collection.delete_one({'_id': conversation_to_delete['_id']})
-            load_transcripts.clear()
+            collection.delete_one({'_id': ObjectId(conversation_to_delete['_id'])})
+            load_transcript_index.clear()
             st.session_state.current_index = 0
             st.session_state.confirm_delete = False
             st.success("Transcript deleted successfully.")
@@ -134,7 +188,12 @@ with st.sidebar:
 
 # 1. Standardly display the last conversation (index 0 of sorted list)
 if 0 <= st.session_state.current_index < total_transcripts:
-    conversation = filtered_transcripts[st.session_state.current_index]
+    entry = filtered_transcripts[st.session_state.current_index]
+    conversation = load_transcript(collection, entry['_id'], entry.get('last_updated_unix'))
+    if conversation is None:
+        st.error("The selected transcript no longer exists.")
+        load_transcript_index.clear()
+        st.stop()
 
     # Display key metadata
     col1, col2, col3 = st.columns(3)
@@ -144,7 +203,25 @@ if 0 <= st.session_state.current_index < total_transcripts:
     st.divider()
 
     st.subheader("Transcript")
-    for message in conversation.get("transcript", []):
+
+    # Render one page of messages at a time, so that navigating long transcripts
+    # does not re-render hundreds of elements
+    messages = conversation.get("transcript", [])
+    page_size = config.BROWSER_MESSAGES_PER_PAGE
+    page_count = max(1, -(-len(messages) // page_size))
+    if st.session_state.get("message_page_of") != entry['_id']:
+        st.session_state.message_page_of = entry['_id']
+        st.session_state.message_page = 1
+    if page_count > 1:
+        st.number_input(
+            f"Page of messages (1–{page_count}, {page_size} messages each):",
+            min_value=1,
+            max_value=page_count,
+            key="message_page",
+        )
+    page_start = (min(st.session_state.message_page, page_count) - 1) * page_size
+
+    for message in messages[page_start:page_start + page_size]:
         role = message.get("role")
         content = message.get("content")
         if role == "assistant":
@@ -154,35 +231,45 @@ if 0 <= st.session_state.current_index < total_transcripts:
         with st.chat_message(role, avatar=avatar):
             st.markdown(content)
 
+    if page_count > 1:
+        st.caption(
+            f"Messages {page_start + 1}–{min(page_start + page_size, len(messages))} "
+            f"of {len(messages)}"
+        )
+
     # 6. Show all metadata
     with st.expander("Metadata", expanded=False):
         # To improve readability, we can convert the MongoDB object to a more readable format
         display_meta = {k: v for k, v in conversation.items() if k not in ['transcript', '_id']}
         st.json(display_meta, expanded=True)
 
-    # 7. Allow to download the transcript
-    def format_transcript_for_download(conv):
-        lines = []
-        for key, value in conv.items():
-            if key != 'transcript' and key != '_id':
-                lines.append(f"{key.replace('_', ' ').title()}: {value}")
-        lines.append("\n---\nTranscript\n---")
-        for msg in conv.get("transcript", []):
-            lines.append(f"\n[{msg.get('role')}]\n{msg.get('content')}")
-        return "\n".join(lines)
-
-    file_content = format_transcript_for_download(conversation)
+    # The system prompt is stored once in the prompt registry and only loaded on request
+    if conversation.get('system_prompt_hash') and st.toggle(
+        f"Show system prompt (version {conversation.get('system_prompt_version')})"
+    ):
+        system_prompt = load_system_prompt(collection, conversation['system_prompt_hash'])
+        if system_prompt is None:
+            st.warning("The system prompt is missing from the prompt registry.")
+        else:
+            st.text(system_prompt)
+
+    # 7. Allow to download the transcript. The file is only built on request, as
+    # most page views do not download it
     start_time_str = conversation.get('start_time_utc', 'unknown_time').replace('/', '-').replace(':', '-')
     end_time_str = conversation.get('end_time_utc', 'unknown_time').replace('/', '-').replace(':', '-')
     file_name = f"{conversation.get('username', 'user')}_{start_time_str}_to_{end_time_str}.txt"
 
-    st.sidebar.download_button(
-        label="Download Transcript",
-        data=file_content,
-        file_name=file_name,
-        mime="text/plain",
-        use_container_width=True
-    )
+    if st.session_state.get("download_prepared_for") == entry['_id']:
+        st.sidebar.download_button(
+            label="Download Transcript",
+            data=get_download_payload(entry['_id'], entry.get('last_updated_unix'), conversation),
+            file_name=file_name,
+            mime="text/plain",
+            use_container_width=True
+        )
+    elif st.sidebar.button("Prepare Download", use_container_width=True):
+        st.session_state.download_prepared_for = entry['_id']
+        st.rerun()
 
 else:
     st.error("Could not find the selected transcript.")
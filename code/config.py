@@ -120,16 +120,33 @@ SYSTEM_PROMPT = f"""{INTERVIEW_OUTLINE}
 
 
 # API parameters
-MODEL = "gpt-5"  # or e.g. "claude-3-5-sonnet-20240620" (OpenAI GPT or Anthropic Claude models)
+MODEL = "gpt-5"  # or e.g. "claude-3-5-sonnet-20240620" (OpenAI GPT or Anthropic Claude models), or "fake" to try the interface offline
 TEMPERATURE = None  # (None for default value)
 MAX_OUTPUT_TOKENS = 2048
 REASONING_EFFORT = "low"  # For GPT-5: minimal, low, medium, or high
+PROMPT_CACHING = True  # Cache the system prompt and conversation prefix across turns
+# OpenAI: continue the previous stored response (previous_response_id) and send only
+# the new messages instead of the full history. Note that this stores responses on
+# OpenAI's servers; falls back to resending the full history if they have expired
+OPENAI_CHAIN_RESPONSES = False
+
+# Offline "fake" model: canned questions streamed word by word, then the closing code
+FAKE_BACKEND_LATENCY_SECONDS = 0.5  # Delay before the first word
+FAKE_BACKEND_TOKENS_PER_SECOND = 30
+FAKE_BACKEND_TURNS = 5  # Questions before the interview is concluded
 
 
 # Display login screen with usernames and simple passwords for studies
 LOGINS = True
 
 
+# Further interviews that run side by side with the one above: each TOML file in
+# this directory (e.g. interviews/pilot.toml) overrides the interview settings
+# (INTERVIEW_OUTLINE, GENERAL_INSTRUCTIONS, CODES, CLOSING_MESSAGES, MODEL,
+# directories, avatars) and is selected with the URL parameter interview=pilot
+INTERVIEW_CONFIGS_DIRECTORY = "interviews/"
+
+
 # Directories
 TRANSCRIPTS_DIRECTORY = "../data/transcripts/"
 TIMES_DIRECTORY = "../data/times/"
@@ -139,3 +156,93 @@ BACKUPS_DIRECTORY = "../data/backups/"
 # Avatars displayed in the chat interface
 AVATAR_INTERVIEWER = "\U0001F393"
 AVATAR_RESPONDENT = "\U0001F9D1\U0000200D\U0001F4BB"
+
+
+# MongoDB connection pool (one pooled client is shared by all sessions of a process)
+MONGO_MAX_POOL_SIZE = 100  # Maximum concurrent connections per server
+MONGO_MIN_POOL_SIZE = 0  # Connections kept open even when idle
+MONGO_MAX_IDLE_TIME_MS = 300000  # Close pooled connections idle for longer than this
+MONGO_CONNECT_TIMEOUT_MS = 10000
+MONGO_SOCKET_TIMEOUT_MS = 20000
+MONGO_SERVER_SELECTION_TIMEOUT_MS = 5000  # Fail fast instead of blocking a turn for 30s
+MONGO_HEARTBEAT_FREQUENCY_MS = 10000  # Interval of the driver's background health checks
+
+
+# Write-behind persistence of per-turn backups (disk and MongoDB writes happen on a
+# background thread instead of delaying the respondent's next turn)
+PERSISTENCE_WRITE_BEHIND = True
+PERSISTENCE_MAX_PENDING = 1000  # Interviews with unwritten snapshots before submit blocks
+PERSISTENCE_BATCH_SIZE = 50  # Snapshots written per MongoDB bulk write
+PERSISTENCE_MAX_BACKOFF_SECONDS = 30  # Upper bound of the retry delay after failed writes
+# Time to drain the queue on shutdown, and at most to wait for an interview's write
+# in progress before its final save
+PERSISTENCE_SHUTDOWN_TIMEOUT_SECONDS = 10
+PERSISTENCE_DEAD_LETTER_FILE = "../data/backups/unsaved_snapshots.jsonl"
+
+
+# Store each distinct system prompt once in this collection (in the interviews'
+# database) and only its hash and version in the interviews, instead of a full copy
+PROMPT_REGISTRY = True
+PROMPT_REGISTRY_COLLECTION = "system_prompts"
+
+
+# Append only new messages to the stored transcript ($push) instead of rewriting it
+# on every turn; falls back to a full rewrite if the stored transcript diverged
+INCREMENTAL_TRANSCRIPT_UPDATES = True
+
+
+# Continue a respondent's latest unfinished interview stored in MongoDB when they
+# return (e.g. reload the page) instead of starting a new one with a new opening
+# message, if it was started less than RESUME_MAX_AGE_SECONDS ago
+RESUME_UNFINISHED_INTERVIEWS = True
+RESUME_MAX_AGE_SECONDS = 24 * 3600
+
+
+# Keep the state of interviews in progress outside of the server process, so that a
+# session can continue on another worker (several workers behind a load balancer)
+# or after a restart: None (only in the worker's memory), "sqlite" (a database file
+# shared by the workers of one machine) or "mongo" (a collection in the interviews'
+# database, for workers on several machines)
+SESSION_STORE = None
+SESSION_STORE_SQLITE_PATH = "../data/sessions.sqlite3"
+SESSION_STORE_COLLECTION = "sessions"
+SESSION_STORE_EXPIRE_AFTER_SECONDS = 7 * 24 * 3600  # Remove sessions idle for longer (0: keep)
+
+
+# Backups of interviews in progress: "files" rewrites a transcript and a time file
+# per turn, "journal" appends only new messages to one JSON lines file per interview
+# (finished journals can be compacted with `python journal.py`)
+BACKUP_BACKEND = "journal"
+JOURNAL_FSYNC_EVERY = 5  # fsync the journal every N appends (0: leave it to the OS)
+
+
+# Final save at the end of an interview (atomic file writes, acknowledged database
+# write, bounded retries with exponential backoff)
+FINALIZE_MAX_ATTEMPTS = 5
+FINALIZE_INITIAL_BACKOFF_SECONDS = 0.2
+FINALIZE_MAX_BACKOFF_SECONDS = 2
+FINALIZE_WRITE_CONCERN = "majority"
+FINALIZE_WRITE_TIMEOUT_MS = 5000
+
+
+# Stream OpenAI replies token by token (falls back to complete replies automatically
+# if the API rejects streaming, e.g. before organization verification)
+OPENAI_STREAMING = True
+
+
+# Re-render a streamed partial message at most every RENDER_MIN_INTERVAL_SECONDS,
+# unless RENDER_MIN_CHARACTERS new characters have arrived since the last update
+RENDER_MIN_INTERVAL_SECONDS = 0.05
+RENDER_MIN_CHARACTERS = 40
+
+
+# Optional exports of the per-turn timings (also stored with each interview's
+# turn_metrics): a JSON lines log file, and a Prometheus/OpenMetrics endpoint on
+# this port (requires `pip install prometheus_client`); None to disable
+TURN_METRICS_LOG = None  # e.g. "../data/turn_metrics.jsonl"
+METRICS_PORT = None  # e.g. 9100
+
+
+# Transcript browser: number of recently viewed full transcripts kept in memory
+BROWSER_CACHED_TRANSCRIPTS = 32
+BROWSER_MESSAGES_PER_PAGE = 50  # Messages of the selected transcript rendered at once
@@ -0,0 +1,179 @@
+import hashlib
+import threading
+import time
+import warnings
+
+from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+import config
+
+
+# One pooled client per process and connection string. Streamlit re-executes the
+# page scripts on every rerun, but imported modules (and thus this cache) persist
+# for the lifetime of the server process.
+_clients = {}
+_clients_lock = threading.Lock()
+
+# Versions of the system prompts registered by this process, by registry and hash
+_prompt_versions = {}
+_prompt_versions_lock = threading.Lock()
+
+
+def get_client(mongo_uri):
+    """Return the process-wide pooled MongoClient for the given connection string."""
+
+    client = _clients.get(mongo_uri)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        # Another thread may have created the client while we waited for the lock
+        client = _clients.get(mongo_uri)
+        if client is None:
+            client = MongoClient(
+                mongo_uri,
+                maxPoolSize=config.MONGO_MAX_POOL_SIZE,
+                minPoolSize=config.MONGO_MIN_POOL_SIZE,
+                maxIdleTimeMS=config.MONGO_MAX_IDLE_TIME_MS,
+                connectTimeoutMS=config.MONGO_CONNECT_TIMEOUT_MS,
+                socketTimeoutMS=config.MONGO_SOCKET_TIMEOUT_MS,
+                serverSelectionTimeoutMS=config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                heartbeatFrequencyMS=config.MONGO_HEARTBEAT_FREQUENCY_MS,
+            )
+            _clients[mongo_uri] = client
+    return client
+
+
+def get_collection(mongo_secrets):
+    """Return the interviews collection described by the 'mongo' secrets section."""
+
+    client = get_client(mongo_secrets["uri"])
+    return client[mongo_secrets["db"]][mongo_secrets["collection"]]
+
+
+def ensure_indexes(collection):
+    """Create the indexes the writers and readers of the interviews collection rely on.
+
+    Creating an existing index is a no-op on the server, so this can run at every
+    startup. If the collection contains duplicate interviews, the unique index is
+    skipped with a warning (see migrate_interviews.py).
+    """
+
+    # Every per-turn upsert filters on the interview's username and start time
+    try:
+        collection.create_index(
+            [("username", 1), ("start_time_unix", 1)],
+            unique=True,
+            name="username_start_time_unique",
+        )
+    except OperationFailure as e:
+        if e.code != 11000:  # Duplicate key
+            raise
+        warnings.warn(
+            f"Duplicate interviews in {collection.full_name}; the unique index on "
+            "username and start_time_unix was not created. Run "
+            "'python migrate_interviews.py --dry-run' to list them."
+        )
+    # Browsing and downloading list interviews sorted by start time
+    collection.create_index("start_time_unix")
+    # Duration filters of the download script (numeric values, see migrate_interviews.py)
+    collection.create_index("duration_minutes")
+    # Incremental exports fetch interviews changed since the last export
+    collection.create_index([("last_updated_unix", 1), ("_id", 1)])
+    # Prompt versions are unique, so concurrent registrations cannot share one
+    get_prompt_registry(collection).create_index("version", unique=True)
+
+
+def find_unfinished_interview(collection, username, started_after, projection=None):
+    """Return a cursor of the latest interview of a user without an end time that
+    started after the given Unix time (empty if there is none).
+
+    The username and start time range are a bounded scan of the unique index on
+    (username, start_time_unix), read backwards for the sort; only the interviews
+    of the user in that range are fetched to check for an end time.
+    """
+
+    return (
+        collection.find(
+            {
+                "username": username,
+                "start_time_unix": {"$gt": started_after},
+                "end_time_unix": {"$exists": False},
+            },
+            projection,
+        )
+        .sort("start_time_unix", -1)
+        .limit(1)
+    )
+
+
+def get_prompt_hash(system_prompt):
+    """Return the content hash identifying a system prompt in the prompt registry."""
+    return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+
+
+def get_prompt_registry(collection):
+    """Return the prompt registry collection next to an interviews collection."""
+    return collection.database[config.PROMPT_REGISTRY_COLLECTION]
+
+
+def register_prompt(collection, system_prompt):
+    """Store a system prompt once in the registry; returns its (hash, version).
+
+    Versions number the distinct prompts in the order they were first registered.
+    """
+    registry = get_prompt_registry(collection)
+    prompt_hash = get_prompt_hash(system_prompt)
+    key = (id(registry.database.client), registry.full_name, prompt_hash)
+    version = _prompt_versions.get(key)
+    if version is not None:
+        return prompt_hash, version
+
+    with _prompt_versions_lock:
+        while True:
+            stored = registry.find_one({"_id": prompt_hash}, {"version": 1})
+            if stored is not None:
+                version = stored["version"]
+                break
+            latest = registry.find_one({}, {"version": 1}, sort=[("version", -1)])
+            version = 1 if latest is None else latest["version"] + 1
+            try:
+                registry.insert_one(
+                    {
+                        "_id": prompt_hash,
+                        "version": version,
+                        "text": system_prompt,
+                        "registered_unix": time.time(),
+                    }
+                )
+                break
+            except DuplicateKeyError:
+                continue  # Registered concurrently (same prompt or same version)
+        _prompt_versions[key] = version
+    return prompt_hash, version
+
+
+def resolve_prompt(collection, prompt_hash):
+    """Return the text of a registered system prompt, or None if it is unknown."""
+    stored = get_prompt_registry(collection).find_one({"_id": prompt_hash}, {"text": 1})
+    return None if stored is None else stored["text"]
+
+
+def check_health(mongo_uri):
+    """Ping the server through the pooled client; returns True if it responds."""
+
+    try:
+        get_client(mongo_uri).admin.command("ping")
+        return True
+    except Exception:
+        return False
+
+
+def close_clients():
+    """Close all pooled clients (e.g. at the end of a command line script)."""
+
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
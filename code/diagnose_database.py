@@ -1,8 +1,9 @@
+import argparse
 import os
-from collections import Counter
 
 import toml
-from pymongo import MongoClient
+
+import database
 
 # --- Configuration ---
 SECRETS_PATH = os.path.join(os.path.dirname(__file__), ".streamlit", "secrets.toml")
@@ -12,13 +13,7 @@ def get_db_collection():
     """Reads secrets, connects to MongoDB, and returns the collection object."""
     try:
         secrets = toml.load(SECRETS_PATH)
-        mongo_uri = secrets["mongo"]["uri"]
-        mongo_db = secrets["mongo"]["db"]
-        mongo_collection = secrets["mongo"]["collection"]
-
-        client = MongoClient(mongo_uri)
-        db = client[mongo_db]
-        return db[mongo_collection]
+        return database.get_collection(secrets["mongo"])
     except FileNotFoundError:
         print(f"Error: Secrets file not found at {SECRETS_PATH}")
         return None
@@ -27,126 +22,260 @@ def get_db_collection():
         return None
 
 
-def diagnose_database():
-    """Analyzes the database to understand what fields exist and their values."""
+MIN_DURATION_MINUTES = 8
+FIELDS = ["start_time_unix", "last_updated_unix", "end_time_unix", "duration_minutes"]
+
+
+def is_present(field):
+    """Aggregation expression that is true if the field exists in a document."""
+    return {"$ne": [{"$type": f"${field}"}, "missing"]}
+
+
+def is_truthy(field):
+    """Aggregation expression mirroring Python truthiness of a scalar field."""
+    return {"$not": [{"$in": [{"$ifNull": [f"${field}", None]}, [None, 0, "", False]]}]}
+
+
+def count_where(condition):
+    """Aggregation accumulator counting the documents matching a condition."""
+    return {"$sum": {"$cond": [condition, 1, 0]}}
+
+
+def build_diagnosis_pipeline(sample_size=None):
+    """Return the aggregation pipeline computing all statistics in one pass.
+
+    Produces a single document with one $facet branch per report section, so the
+    client only receives the summary, independent of the collection size.
+    """
+    minimum_seconds = MIN_DURATION_MINUTES * 60
+    pipeline = []
+    if sample_size:
+        pipeline.append({"$sample": {"size": sample_size}})
+    pipeline += [
+        {
+            "$project": {
+                "username": 1,
+                "start_time_utc": 1,
+                "start_time_unix": 1,
+                "last_updated_unix": 1,
+                "end_time_unix": 1,
+                "duration_minutes": 1,
+                # Stored as a formatted string; None if missing or not a number
+                "duration_value": {
+                    "$convert": {
+                        "input": "$duration_minutes",
+                        "to": "double",
+                        "onError": None,
+                        "onNull": None,
+                    }
+                },
+            }
+        },
+        {
+            "$facet": {
+                "presence": [
+                    {
+                        "$group": {
+                            "_id": None,
+                            "total": {"$sum": 1},
+                            **{field: count_where(is_present(field)) for field in FIELDS},
+                        }
+                    }
+                ],
+                "durations": [
+                    {"$match": {"duration_value": {"$ne": None}}},
+                    {
+                        "$group": {
+                            "_id": None,
+                            "count": {"$sum": 1},
+                            "min": {"$min": "$duration_value"},
+                            "max": {"$max": "$duration_value"},
+                            "average": {"$avg": "$duration_value"},
+                            "valid": count_where(
+                                {"$gte": ["$duration_value", MIN_DURATION_MINUTES]}
+                            ),
+                        }
+                    },
+                ],
+                "invalid_durations": [
+                    {"$match": {"duration_minutes": {"$exists": True}, "duration_value": None}},
+                    {"$project": {"_id": 0, "username": 1, "start_time_utc": 1}},
+                    {"$limit": 10},
+                ],
+                "invalid_count": [
+                    {"$match": {"duration_minutes": {"$exists": True}, "duration_value": None}},
+                    {"$count": "count"},
+                ],
+                "missing_durations": [
+                    {"$match": {"duration_minutes": {"$exists": False}}},
+                    {"$project": {"_id": 0, "username": 1, "start_time_utc": 1}},
+                    {"$limit": 10},
+                ],
+                "missing_count": [
+                    {"$match": {"duration_minutes": {"$exists": False}}},
+                    {"$count": "count"},
+                ],
+                # Old logic: time between start and last update
+                "old_logic": [
+                    {
+                        "$match": {
+                            "$expr": {
+                                "$and": [
+                                    is_truthy("start_time_unix"),
+                                    is_truthy("last_updated_unix"),
+                                    {
+                                        "$gt": [
+                                            {
+                                                "$subtract": [
+                                                    "$last_updated_unix",
+                                                    "$start_time_unix",
+                                                ]
+                                            },
+                                            minimum_seconds,
+                                        ]
+                                    },
+                                ]
+                            }
+                        }
+                    },
+                    {"$count": "count"},
+                ],
+                # New logic: duration_minutes, or end_time_unix if it is missing
+                "new_logic": [
+                    {
+                        "$match": {
+                            "$expr": {
+                                "$cond": [
+                                    is_truthy("duration_minutes"),
+                                    {
+                                        "$gte": [
+                                            {"$ifNull": ["$duration_value", -1]},
+                                            MIN_DURATION_MINUTES,
+                                        ]
+                                    },
+                                    {
+                                        "$and": [
+                                            is_truthy("start_time_unix"),
+                                            is_truthy("end_time_unix"),
+                                            {
+                                                "$gte": [
+                                                    {
+                                                        "$subtract": [
+                                                            "$end_time_unix",
+                                                            "$start_time_unix",
+                                                        ]
+                                                    },
+                                                    minimum_seconds,
+                                                ]
+                                            },
+                                        ]
+                                    },
+                                ]
+                            }
+                        }
+                    },
+                    {"$count": "count"},
+                ],
+            }
+        },
+    ]
+    return pipeline
+
+
+def build_newest_pipeline(count=5):
+    """Return the pipeline fetching the newest interviews of the whole collection
+    (without transcripts); the sort and limit use the start_time_unix index."""
+    return [
+        {"$sort": {"start_time_unix": -1}},
+        {"$limit": count},
+        {
+            "$project": {
+                "_id": 0,
+                "username": 1,
+                "start_time_utc": 1,
+                "duration_minutes": 1,
+                "has_end_time_unix": is_present("end_time_unix"),
+            }
+        },
+    ]
+
+
+def first_or_empty(results):
+    """Return the single result document of a $facet branch, or {} if it is empty."""
+    return results[0] if results else {}
+
+
+def diagnose_database(sample_size=None):
+    """Analyzes the database to understand what fields exist and their values.
+
+    All statistics are computed by the server; with sample_size, they are based on
+    a random sample of that many interviews. The newest interviews are always
+    those of the whole collection.
+    """
     collection = get_db_collection()
     if collection is None:
         return
 
-    all_interviews = list(collection.find({}))
-    total = len(all_interviews)
+    diagnosis = next(
+        collection.aggregate(build_diagnosis_pipeline(sample_size), allowDiskUse=True)
+    )
+    presence = first_or_empty(diagnosis["presence"])
+    total = presence.get("total", 0)
 
     print(f"\n{'=' * 60}")
     print(f"DATABASE DIAGNOSIS")
     print(f"{'=' * 60}\n")
-    print(f"Total interviews in database: {total}\n")
-
-    # Check which fields exist
-    has_duration_minutes = 0
-    has_end_time_unix = 0
-    has_last_updated_unix = 0
-    has_start_time_unix = 0
-
-    duration_values = []
-    interviews_with_valid_duration = []
-    interviews_without_duration = []
-
-    for interview in all_interviews:
-        username = interview.get("username", "unknown")
-        start_time = interview.get("start_time_utc", "unknown")
-
-        if "duration_minutes" in interview:
-            has_duration_minutes += 1
-            try:
-                duration_val = float(interview["duration_minutes"])
-                duration_values.append(duration_val)
-                if duration_val >= 8:
-                    interviews_with_valid_duration.append(
-                        (username, start_time, duration_val)
-                    )
-            except (ValueError, TypeError):
-                print(
-                    f"  Warning: Invalid duration_minutes for {username} at {start_time}"
-                )
-        else:
-            interviews_without_duration.append((username, start_time))
-
-        if "end_time_unix" in interview:
-            has_end_time_unix += 1
-        if "last_updated_unix" in interview:
-            has_last_updated_unix += 1
-        if "start_time_unix" in interview:
-            has_start_time_unix += 1
+    if sample_size:
+        print(f"Random sample of {total} interviews\n")
+    else:
+        print(f"Total interviews in database: {total}\n")
+    if total == 0:
+        return
 
     print(f"Field presence:")
-    print(
-        f"  - start_time_unix:     {has_start_time_unix}/{total} ({100 * has_start_time_unix / total:.1f}%)"
-    )
-    print(
-        f"  - last_updated_unix:   {has_last_updated_unix}/{total} ({100 * has_last_updated_unix / total:.1f}%)"
-    )
-    print(
-        f"  - end_time_unix:       {has_end_time_unix}/{total} ({100 * has_end_time_unix / total:.1f}%)"
-    )
-    print(
-        f"  - duration_minutes:    {has_duration_minutes}/{total} ({100 * has_duration_minutes / total:.1f}%)"
-    )
+    for field in FIELDS:
+        label = f"{field}:"
+        print(f"  - {label:<20} {presence[field]}/{total} ({100 * presence[field] / total:.1f}%)")
 
     print(f"\n{'=' * 60}")
     print(f"DURATION ANALYSIS")
     print(f"{'=' * 60}\n")
 
-    if duration_values:
-        print(f"Interviews with duration_minutes field: {len(duration_values)}")
-        print(f"  - Min duration: {min(duration_values):.2f} minutes")
-        print(f"  - Max duration: {max(duration_values):.2f} minutes")
+    for interview in diagnosis["invalid_durations"]:
         print(
-            f"  - Average duration: {sum(duration_values) / len(duration_values):.2f} minutes"
+            f"  Warning: Invalid duration_minutes for {interview.get('username', 'unknown')} "
+            f"at {interview.get('start_time_utc', 'unknown')}"
         )
-        print(f"  - With duration >= 8 minutes: {len(interviews_with_valid_duration)}")
+    invalid_count = first_or_empty(diagnosis["invalid_count"]).get("count", 0)
+    if invalid_count > 10:
+        print(f"  ... and {invalid_count - 10} more invalid durations")
 
-    print(
-        f"\nInterviews WITHOUT duration_minutes field: {len(interviews_without_duration)}"
-    )
-    if interviews_without_duration:
+    durations = first_or_empty(diagnosis["durations"])
+    if durations:
+        print(f"Interviews with duration_minutes field: {durations['count']}")
+        print(f"  - Min duration: {durations['min']:.2f} minutes")
+        print(f"  - Max duration: {durations['max']:.2f} minutes")
+        print(f"  - Average duration: {durations['average']:.2f} minutes")
+        print(f"  - With duration >= {MIN_DURATION_MINUTES} minutes: {durations['valid']}")
+
+    missing_count = first_or_empty(diagnosis["missing_count"]).get("count", 0)
+    print(f"\nInterviews WITHOUT duration_minutes field: {missing_count}")
+    if missing_count:
         print(f"\nFirst 10 interviews missing duration_minutes:")
-        for username, start_time in interviews_without_duration[:10]:
-            print(f"  - {username} at {start_time}")
-        if len(interviews_without_duration) > 10:
-            print(f"  ... and {len(interviews_without_duration) - 10} more")
+        for interview in diagnosis["missing_durations"]:
+            print(
+                f"  - {interview.get('username', 'unknown')} at "
+                f"{interview.get('start_time_utc', 'unknown')}"
+            )
+        if missing_count > 10:
+            print(f"  ... and {missing_count - 10} more")
 
     print(f"\n{'=' * 60}")
     print(f"DOWNLOAD SCRIPT SIMULATION")
     print(f"{'=' * 60}\n")
 
-    # Simulate old logic (using last_updated_unix)
-    old_logic_count = 0
-    for interview in all_interviews:
-        start_unix = interview.get("start_time_unix")
-        end_unix = interview.get("last_updated_unix")
-        if start_unix and end_unix:
-            duration_seconds = end_unix - start_unix
-            if duration_seconds > 8 * 60:
-                old_logic_count += 1
-
-    # Simulate new logic (using duration_minutes or end_time_unix)
-    new_logic_count = 0
-    for interview in all_interviews:
-        duration_min = interview.get("duration_minutes")
-        if duration_min:
-            try:
-                if float(duration_min) >= 8:
-                    new_logic_count += 1
-            except (ValueError, TypeError):
-                pass
-        else:
-            start_unix = interview.get("start_time_unix")
-            end_unix = interview.get("end_time_unix")
-            if start_unix and end_unix:
-                duration_seconds = end_unix - start_unix
-                if duration_seconds >= 8 * 60:
-                    new_logic_count += 1
-
+    old_logic_count = first_or_empty(diagnosis["old_logic"]).get("count", 0)
+    new_logic_count = first_or_empty(diagnosis["new_logic"]).get("count", 0)
     print(
         f"OLD logic (using last_updated_unix): {old_logic_count} interviews would be downloaded"
     )
@@ -155,33 +284,27 @@ def diagnose_database():
     )
     print(f"Difference: {new_logic_count - old_logic_count} more interviews\n")
 
-    # Sort interviews by start_time_unix to see newest
-    sorted_interviews = sorted(
-        all_interviews, key=lambda x: x.get("start_time_unix", 0), reverse=True
-    )
-
     print(f"{'=' * 60}")
-    print(f"NEWEST 5 INTERVIEWS")
+    print(f"NEWEST 5 INTERVIEWS{' (whole collection, not the sample)' if sample_size else ''}")
     print(f"{'=' * 60}\n")
 
-    for i, interview in enumerate(sorted_interviews[:5]):
+    for i, interview in enumerate(collection.aggregate(build_newest_pipeline(5))):
         username = interview.get("username", "unknown")
         start_time = interview.get("start_time_utc", "unknown")
         duration = interview.get("duration_minutes", "N/A")
-        has_end = "end_time_unix" in interview
         has_duration = "duration_minutes" in interview
 
         print(f"{i + 1}. {username} - {start_time}")
         print(f"   Duration: {duration} minutes")
-        print(f"   Has end_time_unix: {has_end}")
+        print(f"   Has end_time_unix: {interview['has_end_time_unix']}")
         print(f"   Has duration_minutes: {has_duration}")
         if has_duration:
             try:
-                if float(duration) >= 8:
+                if float(duration) >= MIN_DURATION_MINUTES:
                     print(f"   Would be INCLUDED in download")
                 else:
-                    print(f"   Would be EXCLUDED (duration < 8 min)")
-            except:
+                    print(f"   Would be EXCLUDED (duration < {MIN_DURATION_MINUTES} min)")
+            except (ValueError, TypeError):
                 print(f"   Would be EXCLUDED (invalid duration)")
         else:
             print(f"   Would be EXCLUDED (no duration_minutes field)")
@@ -189,4 +312,15 @@ def diagnose_database():
 
 
 if __name__ == "__main__":
-    diagnose_database()
+    parser = argparse.ArgumentParser(
+        description="Diagnose the fields and durations of the interviews in MongoDB.",
+    )
+    parser.add_argument(
+        "--sample",
+        type=int,
+        metavar="N",
+        help="Only analyze a random sample of N interviews (for quick runs on large collections)",
+    )
+    args = parser.parse_args()
+
+    diagnose_database(sample_size=args.sample)
@@ -1,26 +1,63 @@
 import argparse
+import csv
+import glob
+import json
+import multiprocessing
 import os
-from datetime import datetime
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
 
 import toml
-from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+import database
 
 # --- Configuration ---
 SECRETS_PATH = os.path.join(os.path.dirname(__file__), ".streamlit", "secrets.toml")
 DOWNLOAD_DIR = os.path.join(os.path.dirname(__file__), "downloaded_transcripts")
-
-
-def get_db_collection():
-    """Reads secrets, connects to MongoDB, and returns the collection object."""
+CURSOR_BATCH_SIZE = 200  # Interviews fetched per round trip while exporting
+WRITE_BUFFER_SIZE = 1024 * 1024  # Bytes buffered before writing to the export file
+INCREMENTAL_DIR = os.path.join(DOWNLOAD_DIR, "interviews")  # One file per interview
+EXPORT_STATE_PATH = os.path.join(DOWNLOAD_DIR, "export_state.json")
+# Incremental exports re-read interviews updated up to this long before the last
+# exported update: last_updated_unix is set by the app when a snapshot is taken, so a
+# retried write or a worker with a skewed clock can store an older value later
+EXPORT_OVERLAP_SECONDS = 3600
+EXPORT_FORMATS = ["text", "jsonl", "csv", "parquet"]
+PARQUET_ROW_GROUP_SIZE = 50000  # Messages buffered per Parquet row group
+MESSAGE_COLUMNS = [
+    "interview_id",
+    "username",
+    "start_time",
+    "end_time",
+    "duration_minutes",
+    "message_index",
+    "role",
+    "content",
+]
+
+
+def get_db_collection(create_indexes=True):
+    """Reads secrets, connects to MongoDB, and returns the collection object.
+
+    Returns None if the server does not respond, before an export starts. The
+    indexes the exports rely on are created if the database user may do so;
+    exports also work without them.
+    """
     try:
         secrets = toml.load(SECRETS_PATH)
-        mongo_uri = secrets["mongo"]["uri"]
-        mongo_db = secrets["mongo"]["db"]
-        mongo_collection = secrets["mongo"]["collection"]
-
-        client = MongoClient(mongo_uri)
-        db = client[mongo_db]
-        return db[mongo_collection]
+        if not database.check_health(secrets["mongo"]["uri"]):
+            print("Error: The MongoDB server in the secrets file does not respond.")
+            return None
+        collection = database.get_collection(secrets["mongo"])
+        if create_indexes:
+            try:
+                database.ensure_indexes(collection)
+            except PyMongoError as e:
+                print(f"Warning: Indexes not created ({e}); exporting without them.")
+        return collection
     except FileNotFoundError:
         print(f"Error: Secrets file not found at {SECRETS_PATH}")
         return None
@@ -40,8 +77,343 @@ def parse_date(date_str):
         return None
 
 
+def build_filters(min_duration, exclude_usernames, start_date_obj, end_date_obj):
+    """Translate the download filters into MongoDB queries and pipeline stages.
+
+    Returns (username_query, date_query, duration_stages). The date range is
+    applied to the numeric start_time_unix (local midnight of the start date up to
+    the end of the end date), and duration_stages add calculated_duration_minutes
+    (duration_minutes, or end_time_unix - start_time_unix if it is missing, or 0 if
+    both are missing and min_duration is 0) and keep interviews reaching
+    min_duration.
+    """
+    username_query = {}
+    if exclude_usernames:
+        username_query = {"username": {"$nin": list(exclude_usernames)}}
+
+    date_query = {}
+    if start_date_obj or end_date_obj:
+        date_query = {"start_time_unix": {}}
+        if start_date_obj:
+            date_query["start_time_unix"]["$gte"] = time.mktime(start_date_obj.timetuple())
+        if end_date_obj:
+            date_query["start_time_unix"]["$lt"] = time.mktime(
+                (end_date_obj + timedelta(days=1)).timetuple()
+            )
+
+    duration_stages = [
+        {
+            "$addFields": {
+                "calculated_duration_minutes": {
+                    "$cond": [
+                        {"$in": [{"$ifNull": ["$duration_minutes", None]}, [None, "", 0]]},
+                        {
+                            "$cond": [
+                                {
+                                    "$and": [
+                                        {"$gt": ["$start_time_unix", 0]},
+                                        {"$gt": ["$end_time_unix", 0]},
+                                    ]
+                                },
+                                {
+                                    "$divide": [
+                                        {"$subtract": ["$end_time_unix", "$start_time_unix"]},
+                                        60,
+                                    ]
+                                },
+                                0 if min_duration == 0 else None,
+                            ]
+                        },
+                        # Older documents store duration_minutes as a string; invalid values never pass
+                        {
+                            "$convert": {
+                                "input": "$duration_minutes",
+                                "to": "double",
+                                "onError": None,
+                            }
+                        },
+                    ]
+                }
+            }
+        },
+        {"$match": {"calculated_duration_minutes": {"$gte": min_duration}}},
+    ]
+
+    return username_query, date_query, duration_stages
+
+
+def count_filtered_interviews(collection, username_query, date_query, duration_stages):
+    """Count all interviews and those excluded by each filter in one $facet aggregation."""
+    facets = {
+        "total": [{"$count": "count"}],
+        "excluded_by_username": [
+            {"$match": {"username": {"$in": username_query["username"]["$nin"]}}},
+            {"$count": "count"},
+        ]
+        if username_query
+        else [],
+        "excluded_by_date": [
+            {"$match": {**username_query, "$nor": [date_query]}},
+            {"$count": "count"},
+        ]
+        if date_query
+        else [],
+        "selected": [{"$match": {**username_query, **date_query}}]
+        + duration_stages
+        + [{"$count": "count"}],
+        "passed_date": [{"$match": {**username_query, **date_query}}, {"$count": "count"}],
+    }
+    facets = {name: pipeline for name, pipeline in facets.items() if pipeline}
+    result = next(collection.aggregate([{"$facet": facets}]))
+    counts = {
+        name: result[name][0]["count"] if result.get(name) else 0
+        for name in ["total", "excluded_by_username", "excluded_by_date", "selected", "passed_date"]
+    }
+    counts["excluded_by_duration"] = counts["passed_date"] - counts["selected"]
+    return counts
+
+
+def format_interview(number, interview):
+    """Format one interview for the text export."""
+    start_time_str = interview.get("start_time_utc", "N/A")
+    duration_min = interview.get("calculated_duration_minutes", 0)
+    username = interview.get("username", "N/A")
+
+    parts = [
+        f"--------------------\n"
+        f"Interview {number}\n"
+        f"Username: {username}\n"
+        f"Date: {start_time_str}\n"
+        f"Duration: {duration_min:.2f} minutes\n"
+        f"--------------------\n\n"
+    ]
+    for message in interview.get("transcript", []):
+        if message.get("role") != "system":
+            role = message.get("role", "unknown_role").upper()
+            content = message.get("content", "").strip()
+            parts.append(f"[{role}]\n{content}\n\n")
+    parts.append("\n")
+    return "".join(parts)
+
+
+def to_datetime(unix_time):
+    """Convert a unix timestamp to a timezone-aware UTC datetime (None stays None)."""
+    if unix_time is None:
+        return None
+    return datetime.fromtimestamp(unix_time, tz=timezone.utc)
+
+
+def iter_message_rows(interview):
+    """Yield one row per message of an interview, for the CSV and Parquet exports."""
+    interview_id = str(interview["_id"])
+    start_time = to_datetime(interview.get("start_time_unix"))
+    end_time = to_datetime(interview.get("end_time_unix"))
+    message_index = 0
+    for message in interview.get("transcript", []):
+        if message.get("role") != "system":
+            yield {
+                "interview_id": interview_id,
+                "username": interview.get("username"),
+                "start_time": start_time,
+                "end_time": end_time,
+                "duration_minutes": interview.get("calculated_duration_minutes"),
+                "message_index": message_index,
+                "role": message.get("role"),
+                "content": message.get("content", ""),
+            }
+            message_index += 1
+
+
+def format_interview_json(interview):
+    """Format one interview as a JSON line (typed timestamps, numeric duration)."""
+    start_time = to_datetime(interview.get("start_time_unix"))
+    end_time = to_datetime(interview.get("end_time_unix"))
+    record = {
+        "interview_id": str(interview["_id"]),
+        "username": interview.get("username"),
+        "start_time": start_time.isoformat() if start_time else None,
+        "end_time": end_time.isoformat() if end_time else None,
+        "duration_minutes": interview.get("calculated_duration_minutes"),
+        "transcript": [
+            {"role": message.get("role"), "content": message.get("content", "")}
+            for message in interview.get("transcript", [])
+            if message.get("role") != "system"
+        ],
+    }
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def export_shard(output_format, shard_path, query, duration_stages):
+    """Export the interviews matching query to one shard file; returns their number.
+
+    Runs in a worker process with its own database connection (the indexes were
+    created by the parent process).
+    """
+    collection = get_db_collection(create_indexes=False)
+    if collection is None:
+        raise RuntimeError("No connection to MongoDB in an export worker")
+    cursor = collection.aggregate(
+        [{"$match": query}, {"$sort": {"start_time_unix": -1}}]
+        + duration_stages
+        + [{"$project": {"system_prompt": 0}}],
+        batchSize=CURSOR_BATCH_SIZE,
+        allowDiskUse=True,
+    )
+
+    exported = 0
+    try:
+        if output_format == "parquet":
+            # Checked by export_structured before the workers start
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            schema = pa.schema(
+                [
+                    ("interview_id", pa.string()),
+                    ("username", pa.string()),
+                    ("start_time", pa.timestamp("us", tz="UTC")),
+                    ("end_time", pa.timestamp("us", tz="UTC")),
+                    ("duration_minutes", pa.float64()),
+                    ("message_index", pa.int32()),
+                    ("role", pa.string()),
+                    ("content", pa.string()),
+                ]
+            )
+            rows = []
+            with pq.ParquetWriter(shard_path, schema) as writer:
+                for interview in cursor:
+                    rows.extend(iter_message_rows(interview))
+                    exported += 1
+                    if len(rows) >= PARQUET_ROW_GROUP_SIZE:
+                        writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+                        rows = []
+                if rows:
+                    writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+        else:
+            with open(
+                shard_path, "w", encoding="utf-8", newline="", buffering=WRITE_BUFFER_SIZE
+            ) as f:
+                if output_format == "csv":
+                    writer = csv.DictWriter(f, fieldnames=MESSAGE_COLUMNS)
+                    for interview in cursor:
+                        for row in iter_message_rows(interview):
+                            for column in ["start_time", "end_time"]:
+                                if row[column] is not None:
+                                    row[column] = row[column].isoformat()
+                            writer.writerow(row)
+                        exported += 1
+                else:
+                    for interview in cursor:
+                        f.write(format_interview_json(interview))
+                        exported += 1
+    finally:
+        cursor.close()
+
+    return exported
+
+
+def split_by_start_time(collection, query, workers):
+    """Split the interviews matching query into up to `workers` start time ranges,
+    newest range first. Interviews without a numeric start_time_unix (e.g. older
+    documents) are exported with the oldest range."""
+    # The range is taken from numeric start times, which sort before other types
+    numeric_query = {
+        **query,
+        "start_time_unix": {**query.get("start_time_unix", {}), "$type": "number"},
+    }
+    first = collection.find_one(
+        numeric_query, {"start_time_unix": 1}, sort=[("start_time_unix", 1)]
+    )
+    last = collection.find_one(
+        numeric_query, {"start_time_unix": 1}, sort=[("start_time_unix", -1)]
+    )
+    if first is None:
+        return [query] if collection.find_one(query, {"_id": 1}) is not None else []
+    low, high = first.get("start_time_unix"), last.get("start_time_unix")
+    if workers <= 1 or high <= low:
+        return [query]
+
+    step = (high - low) / workers
+    shards = []
+    for i in range(workers):
+        time_range = dict(query.get("start_time_unix", {}))
+        time_range["$gte"] = max(time_range.get("$gte", low), low + i * step)
+        if i < workers - 1:
+            time_range["$lt"] = min(time_range.get("$lt", high + 1), low + (i + 1) * step)
+        if i == 0 and "start_time_unix" not in query:
+            shards.append(
+                {
+                    **query,
+                    "$or": [
+                        {"start_time_unix": time_range},
+                        {"start_time_unix": {"$not": {"$type": "number"}}},
+                    ],
+                }
+            )
+        else:
+            shards.append({**query, "start_time_unix": time_range})
+    return list(reversed(shards))
+
+
+def export_structured(collection, output_format, query, duration_stages, workers):
+    """Export matching interviews as JSONL, CSV or Parquet, formatting time range
+    shards in parallel worker processes.
+
+    JSONL and CSV shards are concatenated into one file; Parquet shards are kept as
+    the part files of a Parquet dataset directory.
+    """
+    if output_format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise SystemExit("Parquet export requires pyarrow (pip install pyarrow).")
+
+    shards = split_by_start_time(collection, query, workers)
+    extension = {"jsonl": "jsonl", "csv": "csv", "parquet": "parquet"}[output_format]
+    output_path = os.path.join(DOWNLOAD_DIR, f"all_transcripts.{extension}")
+
+    if output_format == "parquet":
+        shutil.rmtree(output_path, ignore_errors=True)
+        os.makedirs(output_path)
+        shard_paths = [
+            os.path.join(output_path, f"part-{i:04d}.parquet") for i in range(len(shards))
+        ]
+    else:
+        shard_paths = [f"{output_path}.part{i}" for i in range(len(shards))]
+
+    # Spawned (not forked) workers, as MongoDB clients must not be shared across a fork
+    with ProcessPoolExecutor(
+        max_workers=len(shards), mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        exported = sum(
+            executor.map(
+                export_shard,
+                [output_format] * len(shards),
+                shard_paths,
+                shards,
+                [duration_stages] * len(shards),
+            )
+        )
+
+    if output_format != "parquet":
+        with open(output_path, "w", encoding="utf-8", newline="") as output:
+            if output_format == "csv":
+                csv.DictWriter(output, fieldnames=MESSAGE_COLUMNS).writeheader()
+            for shard_path in shard_paths:
+                with open(shard_path, "r", encoding="utf-8", newline="") as shard:
+                    shutil.copyfileobj(shard, output, WRITE_BUFFER_SIZE)
+                os.remove(shard_path)
+
+    print(f"Successfully saved {exported} interviews to {output_path}")
+
+
 def download_transcripts(
-    min_duration=8, exclude_usernames=None, start_date=None, end_date=None
+    min_duration=8,
+    exclude_usernames=None,
+    start_date=None,
+    end_date=None,
+    output_format="text",
+    workers=1,
 ):
     """Fetches, filters, and saves transcripts to a single file.
 
@@ -50,6 +422,8 @@ def download_transcripts(
         exclude_usernames: List of usernames to exclude (default: None)
         start_date: Start date filter in DD/MM/YYYY format (default: None)
         end_date: End date filter in DD/MM/YYYY format (default: None)
+        output_format: One of EXPORT_FORMATS (default: "text")
+        workers: Worker processes for the JSONL, CSV and Parquet exports (default: 1)
     """
     if exclude_usernames is None:
         exclude_usernames = []
@@ -66,10 +440,6 @@ def download_transcripts(
     start_date_obj = parse_date(start_date)
     end_date_obj = parse_date(end_date)
 
-    all_interviews = list(collection.find({}))
-    # Sort by start_time_unix descending (newest first)
-    all_interviews.sort(key=lambda x: x.get("start_time_unix", 0), reverse=True)
-
     print(f"\nApplying filters:")
     print(
         f"  - Exclude usernames: {exclude_usernames if exclude_usernames else 'None'}"
@@ -78,117 +448,202 @@ def download_transcripts(
     print(f"  - End date: {end_date if end_date else 'None'}")
     print(f"  - Min duration: {min_duration} minutes\n")
 
-    filtered_interviews = []
-    excluded_by_username = 0
-    excluded_by_date = 0
-    excluded_by_duration = 0
-
-    for interview in all_interviews:
-        username = interview.get("username", "")
-        start_time_utc = interview.get("start_time_utc", "")
-
-        # Filter by username
-        if username in exclude_usernames:
-            excluded_by_username += 1
-            continue
-
-        # Filter by date range
-        if start_time_utc and (start_date_obj or end_date_obj):
-            try:
-                # Parse the interview start time (format: DD/MM/YYYY HH:MM:SS)
-                interview_date = datetime.strptime(
-                    start_time_utc.split()[0], "%d/%m/%Y"
-                )
-
-                if start_date_obj and interview_date < start_date_obj:
-                    excluded_by_date += 1
-                    continue
-
-                if end_date_obj and interview_date > end_date_obj:
-                    excluded_by_date += 1
-                    continue
-            except (ValueError, IndexError):
-                print(
-                    f"Warning: Could not parse date for {username} at {start_time_utc}"
-                )
-
-        # Check if interview has duration_minutes field (stored for completed interviews)
-        duration_min = interview.get("duration_minutes")
-
-        if duration_min:
-            # duration_minutes is stored as a string, convert to float
-            try:
-                duration_value = float(duration_min)
-                if duration_value >= min_duration:
-                    interview["calculated_duration_minutes"] = duration_value
-                    filtered_interviews.append(interview)
-                else:
-                    excluded_by_duration += 1
-            except (ValueError, TypeError):
-                print(
-                    f"Warning: Invalid duration_minutes value for interview: {username} at {start_time_utc}"
-                )
-                excluded_by_duration += 1
-        else:
-            # Fallback: Calculate duration if end_time_unix exists (not last_updated_unix)
-            start_unix = interview.get("start_time_unix")
-            end_unix = interview.get("end_time_unix")  # Changed from last_updated_unix
-
-            if start_unix and end_unix:
-                duration_seconds = end_unix - start_unix
-                duration_value = duration_seconds / 60
-                if duration_value >= min_duration:
-                    interview["calculated_duration_minutes"] = duration_value
-                    filtered_interviews.append(interview)
-                else:
-                    excluded_by_duration += 1
-            else:
-                # If no duration info available, include only if min_duration is 0
-                if min_duration == 0:
-                    interview["calculated_duration_minutes"] = 0
-                    filtered_interviews.append(interview)
-                else:
-                    excluded_by_duration += 1
+    # Filter on the server, so that only matching interviews are downloaded
+    username_query, date_query, duration_stages = build_filters(
+        min_duration, exclude_usernames, start_date_obj, end_date_obj
+    )
+    counts = count_filtered_interviews(
+        collection, username_query, date_query, duration_stages
+    )
 
-    if not filtered_interviews:
+    if not counts["selected"]:
         print(
             f"No interviews found with duration greater than or equal to {min_duration} minutes."
         )
         return
 
     print(f"\nFiltering results:")
-    print(f"  - Total interviews in database: {len(all_interviews)}")
-    print(f"  - Excluded by username: {excluded_by_username}")
-    print(f"  - Excluded by date range: {excluded_by_date}")
-    print(f"  - Excluded by duration: {excluded_by_duration}")
-    print(f"  - Interviews to download: {len(filtered_interviews)}\n")
+    print(f"  - Total interviews in database: {counts['total']}")
+    print(f"  - Excluded by username: {counts['excluded_by_username']}")
+    print(f"  - Excluded by date range: {counts['excluded_by_date']}")
+    print(f"  - Excluded by duration: {counts['excluded_by_duration']}")
+    print(f"  - Interviews to download: {counts['selected']}\n")
+
+    if output_format != "text":
+        export_structured(
+            collection,
+            output_format,
+            {**username_query, **date_query},
+            duration_stages,
+            workers,
+        )
+        return
+    if workers > 1:
+        print("Note: the text export is written by a single process (--workers is ignored).")
+
+    # Stream the matching interviews from a cursor, so memory use does not depend on
+    # the number of interviews
+    cursor = collection.aggregate(
+        [
+            {"$match": {**username_query, **date_query}},
+            # Sort by start_time_unix descending (newest first)
+            {"$sort": {"start_time_unix": -1}},
+        ]
+        + duration_stages
+        + [{"$project": {"system_prompt": 0}}],
+        batchSize=CURSOR_BATCH_SIZE,
+        allowDiskUse=True,
+    )
 
     output_filepath = os.path.join(DOWNLOAD_DIR, "all_transcripts.txt")
 
     try:
-        with open(output_filepath, "w", encoding="utf-8") as f:
-            for i, interview in enumerate(filtered_interviews):
-                start_time_str = interview.get("start_time_utc", "N/A")
-                duration_min = interview.get("calculated_duration_minutes", 0)
-
-                username = interview.get("username", "N/A")
-                f.write(f"--------------------\n")
-                f.write(f"Interview {i + 1}\n")
-                f.write(f"Username: {username}\n")
-                f.write(f"Date: {start_time_str}\n")
-                f.write(f"Duration: {duration_min:.2f} minutes\n")
-                f.write(f"--------------------\n\n")
-
-                for message in interview.get("transcript", []):
-                    if message.get("role") != "system":
-                        role = message.get("role", "unknown_role").upper()
-                        content = message.get("content", "").strip()
-                        f.write(f"[{role}]\n{content}\n\n")
-                f.write("\n")
+        with open(
+            output_filepath, "w", encoding="utf-8", buffering=WRITE_BUFFER_SIZE
+        ) as f:
+            for i, interview in enumerate(cursor):
+                f.write(format_interview(i + 1, interview))
 
         print(f"Successfully saved all transcripts to {output_filepath}")
     except IOError as e:
         print(f"Error writing to file {output_filepath}: {e}")
+    finally:
+        cursor.close()
+
+
+def load_export_state(filters):
+    """Return the high-water mark of the last incremental export with these filters."""
+    try:
+        with open(EXPORT_STATE_PATH, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    if state.get("filters") != filters:
+        print("Filters changed since the last incremental export; exporting all interviews again.")
+        for path in glob.glob(os.path.join(INCREMENTAL_DIR, "*.txt")):
+            os.remove(path)
+        return None
+    return state
+
+
+def save_export_state(state):
+    """Store the high-water mark atomically, so an interrupted run cannot corrupt it."""
+    temporary_path = f"{EXPORT_STATE_PATH}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(temporary_path, EXPORT_STATE_PATH)
+
+
+def get_interview_file_path(interview):
+    """Return the path of an interview's file in the incremental export."""
+    start_time_str = (
+        interview.get("start_time_utc", "unknown_time")
+        .replace("/", "-")
+        .replace(":", "-")
+        .replace(" ", "_")
+    )
+    file_name = f"{interview.get('username', 'user')}_{start_time_str}_{interview['_id']}.txt"
+    return os.path.join(INCREMENTAL_DIR, file_name)
+
+
+def download_transcripts_incremental(
+    min_duration=8, exclude_usernames=None, start_date=None, end_date=None
+):
+    """Exports only interviews changed since the last run, one file per interview.
+
+    The latest exported last_updated_unix is kept in EXPORT_STATE_PATH, with the
+    interviews exported within EXPORT_OVERLAP_SECONDS before it. The next run
+    re-reads that overlap and skips the interviews that have not changed since.
+    Changed interviews are rewritten in place; interviews that no longer pass the
+    filters are removed from the export. Interviews deleted from the database are
+    not removed. Arguments as for download_transcripts.
+    """
+    if exclude_usernames is None:
+        exclude_usernames = []
+    collection = get_db_collection()
+    if collection is None:
+        return
+
+    if not os.path.exists(INCREMENTAL_DIR):
+        os.makedirs(INCREMENTAL_DIR)
+        print(f"Created directory: {INCREMENTAL_DIR}")
+
+    filters = {
+        "min_duration": min_duration,
+        "exclude_usernames": sorted(exclude_usernames),
+        "start_date": start_date,
+        "end_date": end_date,
+    }
+    state = load_export_state(filters)
+
+    username_query, date_query, duration_stages = build_filters(
+        min_duration, exclude_usernames, parse_date(start_date), parse_date(end_date)
+    )
+    query = {**username_query, **date_query}
+    last_updated_unix = None
+    recent = {}  # Interview ID -> last_updated_unix, of those in the overlap window
+    if state is not None and state["last_updated_unix"] is not None:
+        last_updated_unix = state["last_updated_unix"]
+        recent = state.get("recent", {})
+        query["last_updated_unix"] = {"$gte": last_updated_unix - EXPORT_OVERLAP_SECONDS}
+        print(
+            f"Exporting interviews updated after "
+            f"{time.strftime('%d/%m/%Y %H:%M:%S', time.localtime(state['last_updated_unix']))}"
+        )
+
+    # Compute the duration of each changed interview, but keep those below the
+    # minimum to remove them from the export if they were exported before
+    cursor = collection.aggregate(
+        [
+            {"$match": query},
+            {"$sort": {"last_updated_unix": 1, "_id": 1}},
+            duration_stages[0],
+            {"$project": {"system_prompt": 0}},
+        ],
+        batchSize=CURSOR_BATCH_SIZE,
+        allowDiskUse=True,
+    )
+
+    written = removed = 0
+    try:
+        for interview in cursor:
+            interview_id = str(interview["_id"])
+            updated = interview.get("last_updated_unix")
+            # Exported by an earlier run and unchanged since
+            if interview_id in recent and recent[interview_id] == updated:
+                continue
+            if updated is not None:
+                recent[interview_id] = updated
+                last_updated_unix = max(updated, last_updated_unix or updated)
+
+            path = get_interview_file_path(interview)
+            duration = interview.get("calculated_duration_minutes")
+            if duration is not None and duration >= min_duration:
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(format_interview(interview["_id"], interview))
+                written += 1
+            elif os.path.exists(path):
+                os.remove(path)
+                removed += 1
+    finally:
+        cursor.close()
+
+    if last_updated_unix is not None:
+        save_export_state(
+            {
+                "filters": filters,
+                "last_updated_unix": last_updated_unix,
+                "recent": {
+                    interview_id: updated
+                    for interview_id, updated in recent.items()
+                    if updated >= last_updated_unix - EXPORT_OVERLAP_SECONDS
+                },
+            }
+        )
+
+    print(f"\nIncremental export to {INCREMENTAL_DIR}:")
+    print(f"  - Interviews written or updated: {written}")
+    print(f"  - Interviews removed (no longer matching the filters): {removed}")
 
 
 if __name__ == "__main__":
@@ -211,6 +666,12 @@ Examples:
 
   # Combine filters
   python download_transcripts.py --exclude-usernames marco --start-date 01/01/2024 --min-duration 10
+
+  # Only export interviews changed since the last run (one file per interview)
+  python download_transcripts.py --incremental
+
+  # One row per message as Parquet, formatted by 4 worker processes
+  python download_transcripts.py --format parquet --workers 4
         """,
     )
 
@@ -242,11 +703,49 @@ Examples:
         help="End date filter in DD/MM/YYYY format (e.g., 31/12/2024)",
     )
 
-    args = parser.parse_args()
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only export interviews changed since the last incremental run, "
+        "one file per interview in downloaded_transcripts/interviews",
+    )
 
-    download_transcripts(
-        min_duration=args.min_duration,
-        exclude_usernames=args.exclude_usernames,
-        start_date=args.start_date,
-        end_date=args.end_date,
+    parser.add_argument(
+        "--format",
+        choices=EXPORT_FORMATS,
+        default="text",
+        help="Export format: text (all_transcripts.txt), jsonl (one interview per line), "
+        "csv or parquet (one row per message) (default: text)",
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Worker processes formatting the jsonl, csv and parquet exports (default: 1)",
     )
+
+    args = parser.parse_args()
+
+    if args.incremental and (args.format != "text" or args.workers != 1):
+        parser.error(
+            "--incremental writes one text file per interview; it cannot be combined "
+            "with --format or --workers"
+        )
+
+    if args.incremental:
+        download_transcripts_incremental(
+            min_duration=args.min_duration,
+            exclude_usernames=args.exclude_usernames,
+            start_date=args.start_date,
+            end_date=args.end_date,
+        )
+    else:
+        download_transcripts(
+            min_duration=args.min_duration,
+            exclude_usernames=args.exclude_usernames,
+            start_date=args.start_date,
+            end_date=args.end_date,
+            output_format=args.format,
+            workers=args.workers,
+        )
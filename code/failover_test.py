@@ -0,0 +1,160 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import config
+
+
+def configure_worker(args, directory):
+    """Configure the app of a worker process like load_test.py (fake backend,
+    temporary directories) with a session store shared by the workers; returns
+    the secrets of the app."""
+    from load_test import configure
+
+    configure(args, directory)
+    config.SESSION_STORE = args.store
+    config.SESSION_STORE_SQLITE_PATH = os.path.join(directory, "sessions.sqlite3")
+
+    secrets = {"passwords": {"PASSWORD": "failover-test"}}
+    if args.store == "mongo":
+        secrets["mongo"] = {
+            "uri": args.mongo_uri,
+            "db": "failover_test",
+            "collection": "interviews",
+        }
+    return secrets
+
+
+def first_worker(args, directory, results):
+    """Start an interview, answer some questions, report it and wait to be killed."""
+    from load_test import create_app_test
+
+    secrets = configure_worker(args, directory)
+    app = create_app_test(
+        args, secrets, {"username": args.username, "password": "failover-test"}
+    )
+    app.run()
+    for turn in range(args.kill_after):
+        app.chat_input[0].set_value(f"Answer {turn} before the failover.").run()
+    # The session is stored by the write-behind worker; let it finish, as the
+    # test is about the failover and not about a write lost with the process
+    import persistence
+
+    persistence.get_worker().flush(timeout=args.timeout)
+
+    results.put(
+        {
+            # URL parameters as the browser would keep them (lists of values)
+            "session": app.query_params["session"][0],
+            "messages": [dict(message) for message in app.session_state.messages],
+            "turns": len(app.session_state.turn_metrics),
+        }
+    )
+    # Mid-interview: the parent kills this worker now
+    time.sleep(3600)
+
+
+def second_worker(args, directory, session, results):
+    """Resume the interview of the killed worker from the session store and finish it."""
+    from load_test import create_app_test
+
+    secrets = configure_worker(args, directory)
+    app = create_app_test(
+        args,
+        secrets,
+        {"username": args.username, "password": "failover-test", "session": session},
+    )
+    app.run()
+    resumed = {
+        "messages": [dict(message) for message in app.session_state.messages],
+        "turns": len(app.session_state.turn_metrics),
+    }
+
+    answers = 0
+    while app.session_state.interview_active and answers <= args.turns:
+        app.chat_input[0].set_value(f"Answer {answers} after the failover.").run()
+        answers += 1
+
+    results.put(
+        {
+            "resumed": resumed,
+            "answers": answers,
+            "exception": [exception.message for exception in app.exception],
+            "interview_active": app.session_state.interview_active,
+            "finalize_state": app.session_state["finalize_status"]["state"]
+            if "finalize_status" in app.session_state
+            else None,
+        }
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Failover test of the session store: a worker process is killed in "
+        "the middle of an interview, and a second worker resumes and finishes it (fake "
+        "backend, temporary directory).",
+    )
+    parser.add_argument("--store", choices=["sqlite", "mongo"], default="sqlite")
+    parser.add_argument(
+        "--mongo-uri",
+        default="mongodb://localhost:27017",
+        help="MongoDB server shared by the workers with --store mongo",
+    )
+    parser.add_argument("--turns", type=int, default=5, help="Questions per interview")
+    parser.add_argument(
+        "--kill-after", type=int, default=2, help="Answers before the first worker is killed"
+    )
+    parser.add_argument("--username", default="failover_test")
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+    # Settings expected by load_test.configure
+    args.latency = 0
+    args.tokens_per_second = 0
+    args.no_mongo = True
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    directory = tempfile.mkdtemp(prefix="interview_failover_test_")
+    print(f"Session store: {args.store}; files in {directory}")
+
+    # Separate processes like the workers behind a load balancer. Each gets its own
+    # queue, as killing a process can leave a shared queue unusable
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    worker = context.Process(target=first_worker, args=(args, directory, results))
+    worker.start()
+    before = results.get(timeout=args.timeout)
+    worker.kill()
+    worker.join()
+    print(
+        f"Killed worker 1 (exit code {worker.exitcode}) after {len(before['messages'])} "
+        f"messages of session {before['session']}"
+    )
+
+    results = context.Queue()
+    worker = context.Process(
+        target=second_worker, args=(args, directory, before["session"], results)
+    )
+    worker.start()
+    after = results.get(timeout=args.timeout * (args.turns + 1))
+    worker.join()
+
+    checks = [
+        ("worker 2 resumed all messages", after["resumed"]["messages"] == before["messages"]),
+        ("no new opening message was generated", after["resumed"]["turns"] == before["turns"]),
+        ("worker 2 finished the interview", not after["interview_active"]),
+        ("the final save succeeded", after["finalize_state"] == "saved"),
+        ("no exceptions", not after["exception"]),
+    ]
+    print(f"Worker 2 answered {after['answers']} further questions")
+    for description, passed in checks:
+        print(f"  {'ok' if passed else 'FAILED':<6} {description}")
+    for exception in after["exception"]:
+        print(f"    {exception}")
+    sys.exit(0 if all(passed for _, passed in checks) else 1)
+
+
+if __name__ == "__main__":
+    main()
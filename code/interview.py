@@ -1,26 +1,24 @@
 import streamlit as st
+import functools
 import time
 from utils import (
     check_if_interview_completed,
-    save_interview_data,
+    finalize_interview,
+    get_mongo_secrets,
     save_interview_data_mongodb,
+    snapshot_interview,
+    write_interview_files,
 )
-import os
+from journal import append_to_journal
+from persistence import get_worker, submit_interview_data
+from metrics import TurnTimer, export_turn_metrics
+from streaming import RenderThrottle
+from backends import create_backend
+from bootstrap import get_interview, list_interview_configs
+from session_store import SESSION_FIELDS, create_session_store
 import hmac
 import config
-
-# Load API library
-if "gpt" in config.MODEL.lower():
-    api = "openai"
-    from openai import OpenAI
-
-elif "claude" in config.MODEL.lower():
-    api = "anthropic"
-    import anthropic
-else:
-    raise ValueError(
-        "Model does not contain 'gpt' or 'claude'; unable to determine API."
-    )
+import database
 
 # Set page title and icon
 st.set_page_config(page_title="Interview", page_icon=config.AVATAR_INTERVIEWER)
@@ -50,15 +48,320 @@ if config.LOGINS:
 else:
     st.session_state.username = "testaccount"
 
-# Create directories if they do not already exist
-if not os.path.exists(config.TRANSCRIPTS_DIRECTORY):
-    os.makedirs(config.TRANSCRIPTS_DIRECTORY)
-if not os.path.exists(config.TIMES_DIRECTORY):
-    os.makedirs(config.TIMES_DIRECTORY)
-if not os.path.exists(config.BACKUPS_DIRECTORY):
-    os.makedirs(config.BACKUPS_DIRECTORY)
+# Store of the interview sessions outside of this process (config.SESSION_STORE),
+# created once per process
+@st.cache_resource
+def get_session_store(kind, mongo_secrets):
+    """Return the process-wide session store, or None if none is configured."""
+    if kind is None:
+        return None
+    return create_session_store(kind, mongo_secrets)
+
+
+def get_session_writer(snapshot):
+    """Return a function that stores the state of the interview as of the snapshot
+    (see utils.snapshot_interview) so that any worker can resume it; None without a
+    session store or if it is unavailable."""
+    if config.SESSION_STORE is None:
+        return None
+    try:
+        session_store = get_session_store(config.SESSION_STORE, get_mongo_secrets())
+    except Exception:
+        # The interview continues; it only cannot be resumed by another worker
+        return None
+    # The snapshot's copies, as the session changes while a write is queued
+    session = {field: st.session_state.get(field) for field in SESSION_FIELDS}
+    for field in ["messages", "interview_active", "turn_metrics", "conversation_state"]:
+        session[field] = snapshot[field]
+    return functools.partial(
+        session_store.save, st.session_state.username, st.session_state.start_time, session
+    )
+
+
+def resume_session(session):
+    """Restore an interview from the session store, given its start time from the
+    URL parameter 'session'; returns False if it is not stored."""
+    try:
+        start_time = float(session)
+        session_store = get_session_store(config.SESSION_STORE, get_mongo_secrets())
+        stored = session_store.load(st.session_state.username, start_time)
+    except Exception:
+        # Not a start time, or the store is unavailable: start a new interview
+        return False
+    if stored is None:
+        return False
+    for field in SESSION_FIELDS:
+        if stored.get(field) is not None:
+            st.session_state[field] = stored[field]
+    st.session_state.start_time = start_time
+    return True
+
+
+# A new session (another worker, a restart or a reloaded page) continues the
+# interview named by the URL parameter 'session' if it is in the session store
+if (
+    config.SESSION_STORE is not None
+    and "messages" not in st.session_state
+    and st.query_params.get("session")
+):
+    resume_session(st.query_params["session"])
+
+# Select the interview: the one in config.py, or a config file named by the URL
+# parameter 'interview'. It stays fixed for the session, and is prepared once per
+# process (system prompt, code matcher, directories)
+if "interview_config" not in st.session_state:
+    interview_config = st.query_params.get("interview")
+    if interview_config and interview_config not in list_interview_configs():
+        st.error(f"Unknown interview '{interview_config}' in URL parameter 'interview'.")
+        st.stop()
+    st.session_state.interview_config = interview_config
+interview = get_interview(st.session_state.interview_config)
+
+
+def get_backup_writer():
+    """Return the function writing backups and its directory/file name arguments."""
+    if config.BACKUP_BACKEND == "journal":
+        return append_to_journal, dict(
+            directory=interview["backups_directory"],
+            file_name_addition=f"_journal_started_{st.session_state.start_time_file_names}",
+        )
+    return write_interview_files, dict(
+        transcripts_directory=interview["backups_directory"],
+        times_directory=interview["backups_directory"],
+        file_name_addition_transcript=f"_transcript_started_{st.session_state.start_time_file_names}",
+        file_name_addition_time=f"_time_started_{st.session_state.start_time_file_names}",
+    )
+
+
+def save_interview_backup(timer):
+    """Store interview progress in the backups and MongoDB.
+
+    With write-behind persistence, the writes are handed to a background worker so
+    that the respondent does not wait for the disk or the database. The durations
+    of the writes are recorded in the turn's timer.
+    """
+    snapshot = snapshot_interview(st.session_state.username, interview["system_prompt"])
+    backup_writer, backup_options = get_backup_writer()
+    session_writer = get_session_writer(snapshot)
+    if config.PERSISTENCE_WRITE_BEHIND:
+        submit_interview_data(
+            snapshot,
+            get_mongo_secrets(),
+            backup_writer,
+            timers=[timer],
+            session_writer=session_writer,
+            **backup_options,
+        )
+    else:
+        if session_writer is not None:
+            started = time.perf_counter()
+            try:
+                session_writer()
+                timer.record_write("session", time.perf_counter() - started)
+            except Exception:
+                # The interview continues; it only cannot be resumed by another worker
+                pass
+        started = time.perf_counter()
+        backup_writer(snapshot, **backup_options)
+        timer.record_write("backup", time.perf_counter() - started)
+        started = time.perf_counter()
+        save_interview_data_mongodb(st.session_state.username, interview["system_prompt"])
+        timer.record_write("database", time.perf_counter() - started)
+        export_turn_metrics(timer.metrics)
+
+
+def cancel_pending_backups():
+    """Cancel the interview's queued backups so they cannot overwrite the final
+    save, and write its final backup (which marks a journal as finished)."""
+    if config.PERSISTENCE_WRITE_BEHIND:
+        get_worker().cancel(
+            (st.session_state.username, st.session_state.start_time),
+            timeout=config.PERSISTENCE_SHUTDOWN_TIMEOUT_SECONDS,
+        )
+    backup_writer, backup_options = get_backup_writer()
+    try:
+        backup_writer(snapshot_interview(st.session_state.username, None), **backup_options)
+    except OSError:
+        pass
+
+
+def store_final_interview(timer=None):
+    """Store the final transcript and time once the interview has ended."""
+    cancel_pending_backups()
+    snapshot = snapshot_interview(st.session_state.username, interview["system_prompt"])
+    st.session_state.finalize_status = finalize_interview(
+        snapshot,
+        get_mongo_secrets(),
+        interview["transcripts_directory"],
+        interview["times_directory"],
+    )
+    # Stored directly, as the interview's queued writes were cancelled above
+    session_writer = get_session_writer(snapshot)
+    if session_writer is not None:
+        try:
+            session_writer()
+        except Exception:
+            pass
+    if timer is not None:
+        # Recorded after the final document was written; they are also part of
+        # the finalize_metrics stored with it
+        timings = st.session_state.finalize_status["timings"]
+        timer.record_write("backup", timings["files_seconds"])
+        if st.session_state.finalize_status["database_saved"] is not None:
+            timer.record_write("database", timings["database_seconds"])
+        export_turn_metrics(timer.metrics)
+
+
+def show_finalize_status():
+    """Tell the respondent if the final save did not succeed completely."""
+    status = st.session_state.get("finalize_status")
+    if status is None or status["state"] == "saved":
+        return
+    if status["state"] == "partial":
+        st.warning(
+            "Your answers were only partially saved. Please keep this page open and "
+            "contact the research team."
+        )
+    else:
+        st.error(
+            "Your answers could not be saved. Please keep this page open and contact "
+            "the research team."
+        )
+
+
+# Create the indexes of the interviews collection once per server process
+@st.cache_resource
+def prepare_database(mongo_secrets):
+    """Create the MongoDB indexes; returns False if that failed (best effort)."""
+    try:
+        database.ensure_indexes(database.get_collection(mongo_secrets))
+        return True
+    except Exception:
+        return False
+
+
+if get_mongo_secrets() is not None:
+    prepare_database(get_mongo_secrets())
+
+# Load the interviewer backend once per process; the cached API client keeps its
+# HTTP connection pool across turns and sessions
+@st.cache_resource
+def get_interviewer_backend(model, system_prompt):
+    """Return the process-wide backend generating the interviewer's messages."""
+    return create_backend(model, system_prompt, st.secrets)
+
+
+backend = get_interviewer_backend(interview["model"], interview["system_prompt"])
+
+
+def is_displayed(content):
+    """Return whether a message is shown in the chat history (it has no code)."""
+    return not any(code in content for code in interview["closing_messages"].keys())
+
+
+def add_message(role, content):
+    """Append a message to the interview, and to the displayed history unless it
+    contains a closing code."""
+    st.session_state.messages.append({"role": role, "content": content})
+    if is_displayed(content):
+        st.session_state.displayed_messages.append({"role": role, "content": content})
 
 
+def get_displayed_messages(messages):
+    """Return the messages of an interview that are shown in the chat history: those
+    after the opening messages without a closing code, and the final message of the
+    standard end without its code (as in live_turn)."""
+    displayed = []
+    for message in messages[len(backend.opening_messages()):]:
+        if is_displayed(message["content"]):
+            displayed.append(message)
+        elif "x7y8" in message["content"]:
+            displayed.append(
+                {
+                    "role": message["role"],
+                    "content": message["content"].replace("x7y8", "").strip(),
+                }
+            )
+    return displayed
+
+
+def show_message(role, content):
+    """Display a message in the chat."""
+    if role == "assistant":
+        avatar = interview["avatar_interviewer"]
+    else:
+        avatar = interview["avatar_respondent"]
+    with st.chat_message(role, avatar=avatar):
+        st.markdown(content)
+
+
+def resume_unfinished_interview():
+    """Continue the respondent's latest unfinished interview stored in MongoDB
+    (e.g. after reloading the page) instead of starting a new one with a new
+    opening message; returns False if there is none to resume."""
+    username = st.session_state.username
+    # Test account has multiple interview attempts
+    if username == "testaccount" or check_if_interview_completed(
+        interview["times_directory"], username
+    ):
+        return False
+    try:
+        stored = next(
+            database.find_unfinished_interview(
+                database.get_collection(get_mongo_secrets()),
+                username,
+                time.time() - config.RESUME_MAX_AGE_SECONDS,
+                {
+                    "start_time_unix": 1,
+                    "transcript": 1,
+                    "turn_metrics": 1,
+                    "conversation_state": 1,
+                    "system_prompt_hash": 1,
+                    "system_prompt": 1,
+                },
+            ),
+            None,
+        )
+    except Exception:
+        return False
+    if stored is None or not stored.get("transcript"):
+        return False
+
+    # Only an interview with the same system prompt (interview and version)
+    if stored.get("system_prompt_hash") != database.get_prompt_hash(
+        interview["system_prompt"]
+    ) and stored.get("system_prompt") != interview["system_prompt"]:
+        return False
+
+    # The stored transcript excludes the system messages that start the history
+    opening_messages = backend.opening_messages()
+    st.session_state.messages = [
+        message for message in opening_messages if message["role"] == "system"
+    ] + [
+        {"role": message["role"], "content": message["content"]}
+        for message in stored["transcript"]
+    ]
+    st.session_state.displayed_messages = get_displayed_messages(st.session_state.messages)
+    st.session_state.turn_metrics = stored.get("turn_metrics", [])
+    st.session_state.conversation_state = stored.get("conversation_state", {})
+    st.session_state.start_time = stored["start_time_unix"]
+    st.session_state.start_time_file_names = time.strftime(
+        "%Y_%m_%d_%H_%M_%S", time.localtime(st.session_state.start_time)
+    )
+    if config.SESSION_STORE is not None:
+        st.query_params["session"] = repr(st.session_state.start_time)
+    return True
+
+
+# A new session of a respondent with an unfinished interview in MongoDB (e.g. a
+# reloaded page) continues it
+if (
+    config.RESUME_UNFINISHED_INTERVIEWS
+    and get_mongo_secrets() is not None
+    and "messages" not in st.session_state
+):
+    resume_unfinished_interview()
+
 # Initialise session state
 if "interview_active" not in st.session_state:
     st.session_state.interview_active = True
@@ -67,12 +370,26 @@ if "interview_active" not in st.session_state:
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
+# Messages shown in the chat history, filtered for closing codes once when they
+# are added, so that reruns only render them. A resumed interview rebuilds them,
+# as the session store keeps only the messages
+if "displayed_messages" not in st.session_state:
+    st.session_state.displayed_messages = get_displayed_messages(st.session_state.messages)
+
+# Provider-side conversation state of the backend (e.g. the ID of the previous
+# OpenAI response)
+if "conversation_state" not in st.session_state:
+    st.session_state.conversation_state = {}
+
 # Store start time in session state
 if "start_time" not in st.session_state:
     st.session_state.start_time = time.time()
     st.session_state.start_time_file_names = time.strftime(
         "%Y_%m_%d_%H_%M_%S", time.localtime(st.session_state.start_time)
     )
+    # Identifies the session in the session store, for a worker that resumes it
+    if config.SESSION_STORE is not None:
+        st.query_params["session"] = repr(st.session_state.start_time)
 
 # Check if interview previously completed
 #interview_previously_completed = check_if_interview_completed(
@@ -99,124 +416,86 @@ with col2:
         # Set interview to inactive, display quit message, and store data
         st.session_state.interview_active = False
         quit_message = "You have cancelled the interview."
-        st.session_state.messages.append({"role": "assistant", "content": quit_message})
-        save_interview_data(
-            st.session_state.username,
-            config.TRANSCRIPTS_DIRECTORY,
-            config.TIMES_DIRECTORY,
-        )
-        save_interview_data_mongodb(st.session_state.username, config.SYSTEM_PROMPT)
+        add_message("assistant", quit_message)
+        store_final_interview()
 
 
-# Upon rerun, display the previous conversation (except system prompt or first message)
-for message in st.session_state.messages[1:]:
+# Show the result of the final save after the interview has ended
+show_finalize_status()
+
+# Upon rerun, display the previous conversation (without the opening messages and
+# messages with codes). New exchanges are added to this container by the live turn
+history = st.container()
+with history:
+    for message in st.session_state.displayed_messages:
+        show_message(message["role"], message["content"])
+
+
+def start_turn_timer():
+    """Start timing the current turn. Its timeline, time to first token, response
+    time and token usage (including prompt cache hits, next to the size of the
+    system prompt) are stored with the interview's turn_metrics."""
+    turn_metrics = st.session_state.setdefault("turn_metrics", [])
+    timer = TurnTimer(len(turn_metrics) + 1, backend.api)
+    timer.metrics["system_prompt_tokens"] = interview["prompt_tokens"]
+    turn_metrics.append(timer.metrics)
+    return timer
 
-    if message["role"] == "assistant":
-        avatar = config.AVATAR_INTERVIEWER
-    else:
-        avatar = config.AVATAR_RESPONDENT
-    # Only display messages without codes
-    if not any(code in message["content"] for code in config.CLOSING_MESSAGES.keys()):
-        with st.chat_message(message["role"], avatar=avatar):
-            st.markdown(message["content"])
-
-# Load API client
-if api == "openai":
-    client = OpenAI(api_key=st.secrets["API_KEY_OPENAI"])
-    # Convert messages for Responses API: change 'system' role to 'developer'
-    input_messages = []
-    for msg in st.session_state.messages:
-        if msg["role"] == "system":
-            input_messages.append({"role": "developer", "content": msg["content"]})
-        else:
-            input_messages.append(msg)
-    api_kwargs = {
-        "stream": False,  # Set to True after organization verification
-        "input": input_messages,
-        "reasoning": {"effort": config.REASONING_EFFORT}
-    }
-elif api == "anthropic":
-    client = anthropic.Anthropic(api_key=st.secrets["API_KEY_ANTHROPIC"])
-    api_kwargs = {
-        "system": config.SYSTEM_PROMPT,
-        "messages": st.session_state.messages
-    }
-
-# API kwargs
-api_kwargs["model"] = config.MODEL
-# Responses API uses max_output_tokens instead of max_tokens
-if api == "openai":
-    api_kwargs["max_output_tokens"] = config.MAX_OUTPUT_TOKENS
-else:
-    api_kwargs["max_tokens"] = config.MAX_OUTPUT_TOKENS
-if config.TEMPERATURE is not None:
-    api_kwargs["temperature"] = config.TEMPERATURE
 
 # In case the interview history is still empty, pass system prompt to model, and
 # generate and display its first message
 if not st.session_state.messages:
 
-    if api == "openai":
-
-        st.session_state.messages.append(
-            {"role": "system", "content": config.SYSTEM_PROMPT}
+    timer = start_turn_timer()
+    st.session_state.messages.extend(backend.opening_messages())
+
+    with history, st.chat_message("assistant", avatar=interview["avatar_interviewer"]):
+        message_placeholder = st.empty()
+        message_interviewer = ""
+        render_throttle = RenderThrottle()
+        usage = {}
+        timer.mark("request_sent")
+        for text_delta in backend.stream_reply(
+            st.session_state.messages, usage, st.session_state.conversation_state
+        ):
+            if text_delta and timer.offset("first_token") is None:
+                timer.mark("first_token")
+            message_interviewer += text_delta
+            if render_throttle.due(len(message_interviewer)):
+                message_placeholder.markdown(message_interviewer + "▌")
+        timer.mark("last_token")
+        timer.finish_reply(
+            usage, backend.is_streaming(st.session_state.conversation_state)
         )
-        # Convert system message to developer for Responses API
-        api_kwargs["input"] = [{"role": "developer", "content": config.SYSTEM_PROMPT}]
-        with st.chat_message("assistant", avatar=config.AVATAR_INTERVIEWER):
-            response = client.responses.create(**api_kwargs)
-            # Extract text from non-streaming response
-            message_interviewer = ""
-            for item in response.output:
-                if hasattr(item, "content") and item.content is not None:
-                    for content in item.content:
-                        if hasattr(content, "text"):
-                            message_interviewer += content.text
-            st.markdown(message_interviewer)
-
-    elif api == "anthropic":
+        message_placeholder.markdown(message_interviewer)
+        timer.mark("render_complete")
 
-        st.session_state.messages.append({"role": "user", "content": "Hi"})
-        with st.chat_message("assistant", avatar=config.AVATAR_INTERVIEWER):
-            message_placeholder = st.empty()
-            message_interviewer = ""
-            with client.messages.stream(**api_kwargs) as stream:
-                for text_delta in stream.text_stream:
-                    if text_delta != None:
-                        message_interviewer += text_delta
-                    message_placeholder.markdown(message_interviewer + "▌")
-            message_placeholder.markdown(message_interviewer)
-
-    st.session_state.messages.append(
-        {"role": "assistant", "content": message_interviewer}
-    )
+    add_message("assistant", message_interviewer)
 
     # Store first backup files to record who started the interview
-    save_interview_data(
-        username=st.session_state.username,
-        transcripts_directory=config.BACKUPS_DIRECTORY,
-        times_directory=config.BACKUPS_DIRECTORY,
-        file_name_addition_transcript=f"_transcript_started_{st.session_state.start_time_file_names}",
-        file_name_addition_time=f"_time_started_{st.session_state.start_time_file_names}",
-    )
-    save_interview_data_mongodb(st.session_state.username, config.SYSTEM_PROMPT)
+    save_interview_backup(timer)
 
 
-# Main chat if interview is active
-if st.session_state.interview_active:
+# The live turn runs as a fragment: submitting a message only reruns this function
+# instead of the whole page. The new exchange is written to the history container
+# outside of the fragment, where it stays when the fragment reruns for the next one
+@st.fragment
+def live_turn():
+    """Chat input and the exchange it starts, while the interview is active."""
+    if not st.session_state.interview_active:
+        return
 
     # Chat input and message for respondent
     if message_respondent := st.chat_input("Your message here"):
-        st.session_state.messages.append(
-            {"role": "user", "content": message_respondent}
-        )
+        timer = start_turn_timer()
+        add_message("user", message_respondent)
 
         # Display respondent message
-        with st.chat_message("user", avatar=config.AVATAR_RESPONDENT):
-            st.markdown(message_respondent)
+        with history:
+            show_message("user", message_respondent)
 
         # Generate and display interviewer message
-        with st.chat_message("assistant", avatar=config.AVATAR_INTERVIEWER):
+        with history, st.chat_message("assistant", avatar=interview["avatar_interviewer"]):
 
             # Create placeholder for message in chat interface
             message_placeholder = st.empty()
@@ -224,73 +503,47 @@ if st.session_state.interview_active:
             # Initialise message of interviewer
             message_interviewer = ""
 
-            if api == "openai":
-
-                # Rebuild input_messages to include the user message that was just appended
-                input_messages = []
-                for msg in st.session_state.messages:
-                    if msg["role"] == "system":
-                        input_messages.append({"role": "developer", "content": msg["content"]})
-                    else:
-                        input_messages.append(msg)
-                api_kwargs["input"] = input_messages
-
-                # Non-streaming response with Responses API
-                response = client.responses.create(**api_kwargs)
-                
-                # Extract text from response
-                for item in response.output:
-                    if hasattr(item, "content") and item.content is not None:
-                        for content in item.content:
-                            if hasattr(content, "text"):
-                                message_interviewer += content.text
-                
-                # Check for codes before displaying
-                if any(code in message_interviewer for code in config.CLOSING_MESSAGES.keys()):
+            # Stream responses, scanning only new text for codes and batching updates
+            # of the displayed partial message
+            closing_code_matcher = interview["closing_code_matcher"].copy()
+            render_throttle = RenderThrottle()
+            usage = {}
+            timer.mark("request_sent")
+            reply = backend.stream_reply(
+                st.session_state.messages, usage, st.session_state.conversation_state
+            )
+            for text_delta in reply:
+                if text_delta and timer.offset("first_token") is None:
+                    timer.mark("first_token")
+                message_interviewer += text_delta
+                if closing_code_matcher.feed(text_delta):
+                    # Stop displaying the progress of the message in case of a code
                     message_placeholder.empty()
-                else:
-                    message_placeholder.markdown(message_interviewer)
-
-            elif api == "anthropic":
-
-                # Stream responses
-                with client.messages.stream(**api_kwargs) as stream:
-                    for text_delta in stream.text_stream:
-                        if text_delta != None:
-                            message_interviewer += text_delta
-                        # Start displaying message only after 5 characters to first check for codes
-                        if len(message_interviewer) > 5:
-                            message_placeholder.markdown(message_interviewer + "▌")
-                        if any(
-                            code in message_interviewer
-                            for code in config.CLOSING_MESSAGES.keys()
-                        ):
-                            # Stop displaying the progress of the message in case of a code
-                            message_placeholder.empty()
-                            break
+                    break
+                # Start displaying message only after 5 characters to first check for
+                # codes, and hold back a trailing part that may still become a code
+                if len(message_interviewer) > 5 and render_throttle.due(len(message_interviewer)):
+                    visible_length = len(message_interviewer) - closing_code_matcher.pending
+                    message_placeholder.markdown(message_interviewer[:visible_length] + "▌")
+            # Close the stream also if it was left early because of a code
+            reply.close()
+            timer.mark("last_token")
+            timer.finish_reply(
+                usage, backend.is_streaming(st.session_state.conversation_state)
+            )
 
             # If no code is in the message, display and store the message
-            if not any(
-                code in message_interviewer for code in config.CLOSING_MESSAGES.keys()
-            ):
+            if closing_code_matcher.matched is None:
 
                 message_placeholder.markdown(message_interviewer)
-                st.session_state.messages.append(
-                    {"role": "assistant", "content": message_interviewer}
-                )
+                timer.mark("render_complete")
+                add_message("assistant", message_interviewer)
 
                 # Regularly store interview progress as backup, but prevent script from
                 # stopping in case of a write error
                 try:
 
-                    save_interview_data(
-                        username=st.session_state.username,
-                        transcripts_directory=config.BACKUPS_DIRECTORY,
-                        times_directory=config.BACKUPS_DIRECTORY,
-                        file_name_addition_transcript=f"_transcript_started_{st.session_state.start_time_file_names}",
-                        file_name_addition_time=f"_time_started_{st.session_state.start_time_file_names}",
-                    )
-                    save_interview_data_mongodb(st.session_state.username, config.SYSTEM_PROMPT)
+                    save_interview_backup(timer)
 
                 except:
 
@@ -298,13 +551,11 @@ if st.session_state.interview_active:
 
             # If code in the message, display the associated closing message instead
             # Loop over all codes
-            for code in config.CLOSING_MESSAGES.keys():
+            for code in interview["closing_messages"].keys():
 
                 if code in message_interviewer:
                     # Store message in list of messages
-                    st.session_state.messages.append(
-                        {"role": "assistant", "content": message_interviewer}
-                    )
+                    add_message("assistant", message_interviewer)
 
                     # Set chat to inactive and display closing message
                     st.session_state.interview_active = False
@@ -314,27 +565,24 @@ if st.session_state.interview_active:
                         # For the standard end, display the LLM's message without the trigger code
                         final_message_to_display = message_interviewer.replace("x7y8", "").strip()
                         st.markdown(final_message_to_display)
+                        # Keep it in the displayed history, unlike the stored message
+                        st.session_state.displayed_messages.append(
+                            {"role": "assistant", "content": final_message_to_display}
+                        )
                     else:
                         # For other cases, display the pre-written message
-                        closing_message = config.CLOSING_MESSAGES[code]
+                        closing_message = interview["closing_messages"][code]
                         st.markdown(closing_message)
                         # Also append this clean, pre-written message to the transcript
-                        st.session_state.messages.append(
-                            {"role": "assistant", "content": closing_message}
-                        )
+                        add_message("assistant", closing_message)
+                    timer.mark("render_complete")
 
                     # Store final transcript and time
-                    final_transcript_stored = False
-                    while final_transcript_stored == False:
+                    store_final_interview(timer)
 
-                        save_interview_data(
-                            username=st.session_state.username,
-                            transcripts_directory=config.TRANSCRIPTS_DIRECTORY,
-                            times_directory=config.TIMES_DIRECTORY,
-                        )
-                        save_interview_data_mongodb(st.session_state.username, config.SYSTEM_PROMPT)
+                    # Rerun the whole page to remove the chat input and the 'Quit'
+                    # button and to show the result of the final save
+                    st.rerun()
 
-                        final_transcript_stored = check_if_interview_completed(
-                            config.TRANSCRIPTS_DIRECTORY, st.session_state.username
-                        )
-                        time.sleep(0.1)
+
+live_turn()
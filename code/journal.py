@@ -0,0 +1,175 @@
+import argparse
+import glob
+import json
+import os
+import threading
+
+import config
+from utils import read_final_interview_start_time, write_final_interview_files
+
+
+# Number of messages already appended to each journal file and appends since the
+# last fsync, kept per process; rebuilt from the file if a journal is reopened
+_journal_state = {}
+_journal_state_lock = threading.Lock()
+
+
+def get_journal_path(directory, username, file_name_addition=""):
+    """Return the path of the journal file of an interview."""
+    return os.path.join(directory, f"{username}{file_name_addition}.jsonl")
+
+
+def append_to_journal(snapshot, directory, file_name_addition=""):
+    """Append the messages of a snapshot that are not yet in the journal.
+
+    Each journal line is a JSON object: a 'start' record, one 'message' record per
+    message and a 'checkpoint' record per append with the save time, which
+    replaces the rewritten times file. Depending on JOURNAL_FSYNC_EVERY, the file
+    is fsynced every few appends (and always once the interview has ended).
+    """
+    path = get_journal_path(directory, snapshot["username"], file_name_addition)
+
+    with _journal_state_lock:
+        state = _journal_state.get(path)
+        if state is None:
+            state = {"message_count": 0, "unsynced_appends": 0, "torn_line": False}
+            if os.path.exists(path):
+                state["message_count"] = len(read_journal(path)["messages"])
+                state["torn_line"] = not ends_with_newline(path)
+            _journal_state[path] = state
+
+        records = []
+        if state["message_count"] == 0 and not os.path.exists(path):
+            records.append(
+                {
+                    "type": "start",
+                    "username": snapshot["username"],
+                    "start_time": snapshot["start_time"],
+                }
+            )
+        for message in snapshot["messages"][state["message_count"]:]:
+            records.append(
+                {"type": "message", "role": message["role"], "content": message["content"]}
+            )
+        records.append(
+            {
+                "type": "checkpoint",
+                "saved_at": snapshot["saved_at"],
+                "message_count": len(snapshot["messages"]),
+                "interview_active": snapshot["interview_active"],
+            }
+        )
+
+        # Terminate a line torn by a crash, so that the new records stay readable
+        data = "\n" if state["torn_line"] else ""
+        data += "".join(json.dumps(record) + "\n" for record in records)
+        try:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(data)
+                state["unsynced_appends"] += 1
+                if not snapshot["interview_active"] or (
+                    config.JOURNAL_FSYNC_EVERY
+                    and state["unsynced_appends"] >= config.JOURNAL_FSYNC_EVERY
+                ):
+                    f.flush()
+                    os.fsync(f.fileno())
+                    state["unsynced_appends"] = 0
+        except OSError:
+            # The file may end in a partial line now; rebuild the state next time
+            del _journal_state[path]
+            raise
+        state["torn_line"] = False
+
+        state["message_count"] = len(snapshot["messages"])
+        if not snapshot["interview_active"]:
+            del _journal_state[path]
+
+
+def ends_with_newline(path):
+    """Return whether a file is empty or its last line is complete."""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return True
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def read_journal(path):
+    """Rebuild the current state of an interview from its journal.
+
+    Returns a snapshot-like dict (username, start_time, messages, saved_at,
+    interview_active). Partially written lines, e.g. after a crash, are skipped.
+    """
+    interview = {
+        "username": None,
+        "start_time": None,
+        "messages": [],
+        "saved_at": None,
+        "interview_active": True,
+    }
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record["type"] == "start":
+                interview["username"] = record["username"]
+                interview["start_time"] = record["start_time"]
+            elif record["type"] == "message":
+                interview["messages"].append(
+                    {"role": record["role"], "content": record["content"]}
+                )
+            elif record["type"] == "checkpoint":
+                interview["saved_at"] = record["saved_at"]
+                interview["interview_active"] = record["interview_active"]
+    return interview
+
+
+def compact_journal(path, transcripts_directory, times_directory, remove=False):
+    """Write the final transcript and time files of a finished journal, with the
+    same names as finalize_interview.
+
+    Final files of the same interview (written by finalize_interview) or of a later
+    interview of the same username are kept. Returns True if the journal belonged
+    to a finished interview and was compacted.
+    """
+    interview = read_journal(path)
+    if interview["interview_active"] or interview["username"] is None:
+        return False
+
+    final_start_time = read_final_interview_start_time(times_directory, interview["username"])
+    if final_start_time is not None and final_start_time >= int(interview["start_time"]):
+        return False
+
+    write_final_interview_files(interview, transcripts_directory, times_directory)
+    if remove:
+        os.remove(path)
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compact finished interview journals into final transcripts.",
+    )
+    parser.add_argument(
+        "--directory",
+        default=config.BACKUPS_DIRECTORY,
+        help=f"Directory containing the journals (default: {config.BACKUPS_DIRECTORY})",
+    )
+    parser.add_argument(
+        "--remove",
+        action="store_true",
+        help="Delete journals after they have been compacted",
+    )
+    args = parser.parse_args()
+
+    compacted = 0
+    for path in sorted(glob.glob(os.path.join(args.directory, "*_journal_started_*.jsonl"))):
+        if compact_journal(
+            path, config.TRANSCRIPTS_DIRECTORY, config.TIMES_DIRECTORY, args.remove
+        ):
+            compacted += 1
+            print(f"Compacted {path}")
+    print(f"{compacted} finished journal(s) compacted into {config.TRANSCRIPTS_DIRECTORY}")
@@ -0,0 +1,92 @@
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import config
+
+
+def start_worker(port, metrics_port, streamlit_args):
+    """Start a Streamlit server process of interview.py on a port, with its own
+    port for the Prometheus endpoint (if METRICS_PORT is set)."""
+    environment = dict(os.environ)
+    if metrics_port is not None:
+        environment["INTERVIEW_METRICS_PORT"] = str(metrics_port)
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "streamlit",
+            "run",
+            "interview.py",
+            "--server.port",
+            str(port),
+            "--server.headless",
+            "true",
+            *streamlit_args,
+        ],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=environment,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run several Streamlit server processes of interview.py on "
+        "consecutive ports, to be placed behind a load balancer. Workers that exit "
+        "are restarted; interviews continue from the session store (SESSION_STORE "
+        "in config.py). Further arguments are passed to 'streamlit run'.",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--base-port", type=int, default=8501)
+    parser.add_argument(
+        "--restart-delay",
+        type=float,
+        default=1,
+        help="Seconds before a worker that exited is restarted",
+    )
+    args, streamlit_args = parser.parse_known_args()
+
+    if config.SESSION_STORE is None:
+        print(
+            "Warning: SESSION_STORE is None in config.py, so interviews cannot move "
+            "between workers. Use a load balancer with sticky sessions, or set it to "
+            "'sqlite' (one machine) or 'mongo'."
+        )
+
+    # Stop the workers also when the launcher is terminated (e.g. by a service manager)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    ports = [args.base_port + i for i in range(args.workers)]
+    # Workers cannot share the port of the metrics endpoint; number them from METRICS_PORT
+    metrics_ports = {
+        port: None if config.METRICS_PORT is None else config.METRICS_PORT + i
+        for i, port in enumerate(ports)
+    }
+    workers = {port: start_worker(port, metrics_ports[port], streamlit_args) for port in ports}
+    print("Workers for the load balancer, e.g. an nginx upstream:")
+    for port in ports:
+        print(f"    server 127.0.0.1:{port};")
+    if config.METRICS_PORT is not None:
+        print(f"Metrics endpoints on ports {', '.join(map(str, metrics_ports.values()))}")
+
+    try:
+        while True:
+            time.sleep(args.restart_delay)
+            for port, worker in workers.items():
+                if worker.poll() is not None:
+                    print(f"Worker on port {port} exited ({worker.returncode}); restarting")
+                    workers[port] = start_worker(port, metrics_ports[port], streamlit_args)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for worker in workers.values():
+            worker.terminate()
+        for worker in workers.values():
+            worker.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import tempfile
+import time
+
+import config
+
+
+def percentile(values, fraction):
+    """Return the value below which the given fraction of the sorted values lies."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def format_percentiles(values):
+    """Format p50/p95/p99 of latencies in seconds as milliseconds."""
+    if not values:
+        return f"{'-':>8} {'-':>8} {'-':>8}"
+    return " ".join(
+        f"{1000 * percentile(values, fraction):8.0f}" for fraction in [0.5, 0.95, 0.99]
+    )
+
+
+def get_resident_memory():
+    """Return the resident memory of this process in bytes (Linux), or None."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def configure(args, directory):
+    """Point the app at a temporary directory, the fake backend and a mongomock
+    stand-in of MongoDB. Must run before the app's modules are imported."""
+    config.MODEL = "fake"
+    config.FAKE_BACKEND_LATENCY_SECONDS = args.latency
+    config.FAKE_BACKEND_TOKENS_PER_SECOND = args.tokens_per_second
+    config.FAKE_BACKEND_TURNS = args.turns
+    config.TRANSCRIPTS_DIRECTORY = os.path.join(directory, "transcripts") + "/"
+    config.TIMES_DIRECTORY = os.path.join(directory, "times") + "/"
+    config.BACKUPS_DIRECTORY = os.path.join(directory, "backups") + "/"
+    config.PERSISTENCE_DEAD_LETTER_FILE = os.path.join(directory, "unsaved_snapshots.jsonl")
+    for path in [config.TRANSCRIPTS_DIRECTORY, config.TIMES_DIRECTORY, config.BACKUPS_DIRECTORY]:
+        os.makedirs(path, exist_ok=True)
+
+    if not args.no_mongo:
+        import mongomock
+
+        import database
+
+        database._clients["mongomock://load-test"] = mongomock.MongoClient()
+
+
+def create_app_test(args, secrets, query_params):
+    """Return an AppTest session of interview.py with the given secrets and URL
+    parameters."""
+    from streamlit.testing.v1 import AppTest
+
+    # Session state is inspected between the runs, outside of a script run
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").setLevel(
+        logging.ERROR
+    )
+    app = AppTest.from_file(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "interview.py"),
+        default_timeout=args.timeout,
+    )
+    for section, values in secrets.items():
+        app.secrets[section] = values
+    for name, value in query_params.items():
+        app.query_params[name] = value
+    return app
+
+
+def get_secrets(args):
+    """Return the app's secrets for a load test (the mongomock stand-in of configure)."""
+    secrets = {"passwords": {"PASSWORD": "load-test"}}
+    if not args.no_mongo:
+        secrets["mongo"] = {
+            "uri": "mongomock://load-test",
+            "db": "load_test",
+            "collection": "interviews",
+        }
+    return secrets
+
+
+def instrument_persistence(latencies):
+    """Record the duration of every batch written by the persistence worker."""
+    import persistence
+
+    write_batch = persistence.PersistenceWorker._write_batch
+
+    def timed_write_batch(self, batch):
+        started = time.perf_counter()
+        try:
+            return write_batch(self, batch)
+        finally:
+            latencies.append(time.perf_counter() - started)
+
+    persistence.PersistenceWorker._write_batch = timed_write_batch
+
+
+def run_respondent(args, directory, username, start_barrier, results):
+    """Drive one simulated respondent through a complete interview.
+
+    Runs in its own process, as AppTest swaps process-wide state (runtime,
+    secrets) around every run and cannot run sessions concurrently in one process.
+    Puts a dict with the measurements (or the error) in the results queue.
+    """
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    configure(args, directory)
+    persistence_latencies = []
+    instrument_persistence(persistence_latencies)
+    result = {
+        "turn_latencies": [],
+        "ttft": [],
+        "persistence_latencies": persistence_latencies,
+        "memory": None,
+        "cpu": 0.0,
+        "started": None,
+        "finished": None,
+        "error": None,
+    }
+
+    try:
+        # The app's modules are loaded before the respondents start together, so
+        # that neither the start-up nor its memory counts towards the session
+        import backends, bootstrap, persistence, session_store, utils  # noqa: F401
+
+        app = create_app_test(
+            args, get_secrets(args), {"username": username, "password": "load-test"}
+        )
+        start_barrier.wait(timeout=args.timeout)
+        result["started"] = time.time()
+        memory_before = get_resident_memory()
+        cpu_before = time.process_time()
+
+        started = time.perf_counter()
+        app.run()
+        result["turn_latencies"].append(time.perf_counter() - started)
+        for turn in range(args.turns + 1):
+            if app.exception:
+                raise RuntimeError(app.exception[0].message)
+            if not app.session_state.interview_active:
+                break
+            time.sleep(args.think_time)
+            started = time.perf_counter()
+            app.chat_input[0].set_value(f"Answer {turn} of {username}.").run()
+            result["turn_latencies"].append(time.perf_counter() - started)
+        if app.exception:
+            raise RuntimeError(app.exception[0].message)
+        result["ttft"] = [
+            metrics["time_to_first_token_seconds"]
+            for metrics in app.session_state.turn_metrics
+            if metrics["time_to_first_token_seconds"] is not None
+        ]
+
+        # Session state stays alive in the AppTest object until here, like the
+        # session of a connected respondent in a server
+        memory_after = get_resident_memory()
+        if memory_before is not None:
+            result["memory"] = max(0, memory_after - memory_before)
+        persistence.get_worker().flush(timeout=config.PERSISTENCE_SHUTDOWN_TIMEOUT_SECONDS)
+        result["cpu"] = time.process_time() - cpu_before
+        result["finished"] = time.time()
+    except Exception as e:
+        result["error"] = f"{username}: {e}"
+    results.put(result)
+
+
+def run_level(args, directory, concurrency):
+    """Run `concurrency` simultaneous respondents and summarise the measurements."""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    start_barrier = context.Barrier(concurrency)
+    processes = [
+        context.Process(
+            target=run_respondent,
+            args=(args, directory, f"loadtest_{concurrency}_{i}", start_barrier, results),
+        )
+        for i in range(concurrency)
+    ]
+    for process in processes:
+        process.start()
+    respondents = []
+    for process in processes:
+        try:
+            respondents.append(results.get(timeout=args.timeout * (args.turns + 2)))
+        except queue.Empty:
+            respondents.append({"error": "a respondent process returned no result"})
+    for process in processes:
+        process.join()
+
+    # A failed respondent is reported, and its measurements are left out
+    errors = [respondent["error"] for respondent in respondents if respondent["error"]]
+    completed = [respondent for respondent in respondents if not respondent["error"]]
+    turn_latencies = [value for r in completed for value in r["turn_latencies"]]
+    ttft = [value for r in completed for value in r["ttft"]]
+    persistence_latencies = [value for r in completed for value in r["persistence_latencies"]]
+    memory = [r["memory"] for r in completed if r["memory"] is not None]
+    # CPU time of all respondent processes relative to the wall time of the level;
+    # 100% is one busy core
+    cpu = sum(r["cpu"] for r in completed)
+    wall = (
+        max(r["finished"] for r in completed) - min(r["started"] for r in completed)
+        if completed
+        else 0
+    )
+    memory_per_session = sum(memory) / len(memory) if memory else None
+
+    print(
+        f"{concurrency:>11} {format_percentiles(turn_latencies)} "
+        f"{format_percentiles(ttft)} "
+        f"{format_percentiles(persistence_latencies)} "
+        f"{'-' if memory_per_session is None else f'{memory_per_session / 2**20:.1f}':>8} "
+        f"{100 * cpu / wall if wall else 0:>6.0f}% {len(errors):>6}"
+    )
+    for error in errors[:3]:
+        print(f"    {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load test of interview.py with simulated concurrent respondents. "
+        "Each respondent is a Streamlit AppTest session in its own process, talking to "
+        "the fake backend and an in-memory mongomock stand-in of MongoDB.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        nargs="+",
+        default=[1, 5, 10, 25],
+        help="Numbers of simultaneous respondents to test (default: 1 5 10 25)",
+    )
+    parser.add_argument("--turns", type=int, default=5, help="Questions per interview")
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=config.FAKE_BACKEND_LATENCY_SECONDS,
+        help="Simulated model latency before the first token in seconds",
+    )
+    parser.add_argument(
+        "--tokens-per-second",
+        type=float,
+        default=config.FAKE_BACKEND_TOKENS_PER_SECOND,
+        help="Simulated model output rate (0 for no delay)",
+    )
+    parser.add_argument(
+        "--think-time",
+        type=float,
+        default=0,
+        help="Seconds a respondent waits before answering",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=120, help="Timeout of a single script run"
+    )
+    parser.add_argument(
+        "--no-mongo", action="store_true", help="Only write the local backups"
+    )
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="interview_load_test_")
+
+    print(
+        f"Simulated model: {args.latency} s latency, {args.tokens_per_second} tokens/s; "
+        f"{args.turns} turns per interview; files in {directory}\n"
+    )
+    percentiles = f"{'p50':>8} {'p95':>8} {'p99':>8}"
+    print(
+        f"{'':>11} {'turn latency (ms)':^26} {'time to first token (ms)':^26} "
+        f"{'persistence batch (ms)':^26} {'MiB per':>8} {'CPU':>7} {'errors':>6}"
+    )
+    print(
+        f"{'concurrency':>11} {percentiles} {percentiles} {percentiles} "
+        f"{'session':>8} {'':>7} {'':>6}"
+    )
+    for concurrency in args.concurrency:
+        run_level(args, directory, concurrency)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import json
+import os
+import threading
+import time
+import warnings
+
+import config
+
+
+class TurnTimer:
+    """Timeline of one interview turn, kept in the turn's metrics dict.
+
+    The dict is appended to the session's turn_metrics and stored with the
+    interview in MongoDB. 'offsets' holds the seconds from the start of the turn
+    (the respondent's message, or the start of the interview for the opening
+    message) to each event: request_sent, first_token, last_token,
+    render_complete, session_written if a session store is configured, and
+    backup_written / database_written once the persistence worker has stored the
+    turn. session_seconds, backup_seconds and database_seconds are the durations
+    of those writes.
+    """
+
+    def __init__(self, turn, api):
+        self._started = time.perf_counter()
+        self.metrics = {"turn": turn, "api": api, "offsets": {}}
+
+    def mark(self, event):
+        """Record the time of an event of the turn."""
+        offsets = dict(self.metrics["offsets"])
+        offsets[event] = round(time.perf_counter() - self._started, 6)
+        # Replaced instead of updated, as snapshots may copy the dict concurrently
+        self.metrics["offsets"] = offsets
+
+    def offset(self, event):
+        """Return the offset of an event in seconds, or None if it has not happened."""
+        return self.metrics["offsets"].get(event)
+
+    def finish_reply(self, usage, streamed):
+        """Derive the model timings once the reply is complete, and add its token usage."""
+        request_sent, first_token, last_token = (
+            self.offset("request_sent"),
+            self.offset("first_token"),
+            self.offset("last_token"),
+        )
+        self.metrics["time_to_first_token_seconds"] = (
+            None if first_token is None else round(first_token - request_sent, 6)
+        )
+        self.metrics["response_seconds"] = round(last_token - request_sent, 6)
+        self.metrics["streamed"] = streamed
+        self.metrics.update(usage)
+
+    def record_write(self, step, seconds):
+        """Record a completed backup ("backup") or database ("database") write."""
+        self.metrics[f"{step}_seconds"] = round(seconds, 6)
+        self.mark(f"{step}_written")
+
+
+# Optional exports of completed turns: a JSON lines log and a Prometheus endpoint
+_export_lock = threading.Lock()
+_prometheus = None
+
+
+def get_metrics_port():
+    """Return the port of this process's Prometheus endpoint: METRICS_PORT, or the
+    port assigned to the worker by launch_workers.py."""
+    return int(os.environ.get("INTERVIEW_METRICS_PORT", config.METRICS_PORT))
+
+
+def get_prometheus_metrics():
+    """Start the Prometheus endpoint on first use; returns its metrics, or None."""
+    global _prometheus
+    if _prometheus is None:
+        try:
+            import prometheus_client
+        except ImportError:
+            warnings.warn("METRICS_PORT is set, but prometheus_client is not installed.")
+            _prometheus = False
+            return None
+        port = get_metrics_port()
+        try:
+            prometheus_client.start_http_server(port)
+        except OSError as e:
+            # E.g. the port is used by another process; the endpoint is skipped
+            warnings.warn(f"The metrics endpoint could not be started on port {port}: {e}")
+            _prometheus = False
+            return None
+        _prometheus = {
+            "phases": prometheus_client.Histogram(
+                "interview_turn_phase_seconds",
+                "Duration of the phases of interview turns",
+                ["api", "phase"],
+                buckets=[0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60],
+            ),
+            "tokens": prometheus_client.Counter(
+                "interview_tokens",
+                "Tokens processed by the language model",
+                ["api", "kind"],
+            ),
+        }
+    return _prometheus or None
+
+
+def export_turn_metrics(metrics):
+    """Write a completed turn to the configured metrics exports (if any)."""
+    if not (config.TURN_METRICS_LOG or config.METRICS_PORT):
+        return
+    metrics = dict(metrics)
+
+    with _export_lock:
+        if config.TURN_METRICS_LOG:
+            try:
+                with open(config.TURN_METRICS_LOG, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"logged_at": time.time(), **metrics}) + "\n")
+            except OSError:
+                pass
+
+        if config.METRICS_PORT and (prometheus := get_prometheus_metrics()):
+            offsets = metrics["offsets"]
+            phases = {
+                "request": offsets.get("request_sent"),
+                "time_to_first_token": metrics.get("time_to_first_token_seconds"),
+                "response": metrics.get("response_seconds"),
+                "render": (
+                    offsets["render_complete"] - offsets["last_token"]
+                    if "render_complete" in offsets and "last_token" in offsets
+                    else None
+                ),
+                "backup": metrics.get("backup_seconds"),
+                "database": metrics.get("database_seconds"),
+                "turn": max(offsets.values(), default=None),
+            }
+            for phase, seconds in phases.items():
+                if seconds is not None:
+                    prometheus["phases"].labels(metrics["api"], phase).observe(seconds)
+            for kind in [
+                "input_tokens",
+                "cached_input_tokens",
+                "cache_creation_input_tokens",
+                "output_tokens",
+            ]:
+                if metrics.get(kind):
+                    prometheus["tokens"].labels(metrics["api"], kind).inc(metrics[kind])
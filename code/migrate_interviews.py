@@ -0,0 +1,183 @@
+import argparse
+import os
+
+import toml
+
+import config
+import database
+
+# --- Configuration ---
+SECRETS_PATH = os.path.join(os.path.dirname(__file__), ".streamlit", "secrets.toml")
+
+# Each migration: (description, filter of documents to update, pipeline update).
+# The updates run on the server, so no transcripts are downloaded.
+MIGRATIONS = [
+    (
+        "numeric duration_minutes",
+        {"duration_minutes": {"$type": "string"}},
+        [
+            {
+                "$set": {
+                    "duration_minutes": {
+                        "$convert": {
+                            "input": "$duration_minutes",
+                            "to": "double",
+                            # Keep values that are not numbers for manual inspection
+                            "onError": "$duration_minutes",
+                        }
+                    }
+                }
+            }
+        ],
+    ),
+    (
+        "message_count",
+        {"message_count": {"$exists": False}},
+        [{"$set": {"message_count": {"$size": {"$ifNull": ["$transcript", []]}}}}],
+    ),
+    (
+        "start_time as BSON date",
+        {"start_time": {"$exists": False}, "start_time_unix": {"$type": "number"}},
+        [{"$set": {"start_time": {"$toDate": {"$multiply": ["$start_time_unix", 1000]}}}}],
+    ),
+    (
+        "end_time as BSON date",
+        {"end_time": {"$exists": False}, "end_time_unix": {"$type": "number"}},
+        [{"$set": {"end_time": {"$toDate": {"$multiply": ["$end_time_unix", 1000]}}}}],
+    ),
+]
+
+
+def get_db_collection():
+    """Reads secrets, connects to MongoDB, and returns the collection object."""
+    try:
+        secrets = toml.load(SECRETS_PATH)
+        return database.get_collection(secrets["mongo"])
+    except FileNotFoundError:
+        print(f"Error: Secrets file not found at {SECRETS_PATH}")
+        return None
+    except (KeyError, Exception) as e:
+        print(f"Error connecting to MongoDB or reading secrets: {e}")
+        return None
+
+
+def find_duplicate_interviews(collection):
+    """Return the (username, start_time_unix) keys stored in more than one document."""
+    return list(
+        collection.aggregate(
+            [
+                {
+                    "$group": {
+                        "_id": {"username": "$username", "start_time_unix": "$start_time_unix"},
+                        "count": {"$sum": 1},
+                    }
+                },
+                {"$match": {"count": {"$gt": 1}}},
+            ],
+            allowDiskUse=True,
+        )
+    )
+
+
+def dedupe_system_prompts(collection, dry_run=False):
+    """Move the system prompts stored in interviews to the prompt registry.
+
+    Each distinct prompt is registered once; the interviews keep only its hash and
+    version. Returns the number of prompt bytes removed from the interviews minus
+    those added to the registry.
+    """
+    prompts = collection.aggregate(
+        [
+            {"$match": {"system_prompt": {"$type": "string"}}},
+            {"$group": {"_id": "$system_prompt", "count": {"$sum": 1}}},
+        ],
+        allowDiskUse=True,
+    )
+
+    bytes_saved = 0
+    for prompt in prompts:
+        text = prompt["_id"]
+        if dry_run:
+            print(
+                f"  - prompt {database.get_prompt_hash(text)[:12]}: "
+                f"{prompt['count']} interviews"
+            )
+        else:
+            prompt_hash, version = database.register_prompt(collection, text)
+            result = collection.update_many(
+                {"system_prompt": text},
+                {
+                    "$set": {
+                        "system_prompt_hash": prompt_hash,
+                        "system_prompt_version": version,
+                    },
+                    "$unset": {"system_prompt": ""},
+                },
+            )
+            print(
+                f"  - prompt {prompt_hash[:12]} (version {version}): "
+                f"{result.modified_count} interviews updated"
+            )
+        # All copies but the one now kept in the registry
+        bytes_saved += (prompt["count"] - 1) * len(text.encode("utf-8"))
+    return bytes_saved
+
+
+def migrate_interviews(dry_run=False):
+    """Backfill normalized fields in existing interviews and create the indexes."""
+    collection = get_db_collection()
+    if collection is None:
+        return
+
+    print(f"Migrating {collection.full_name}{' (dry run)' if dry_run else ''}:")
+    for description, query, update in MIGRATIONS:
+        if dry_run:
+            count = collection.count_documents(query)
+            print(f"  - {description}: {count} interviews to update")
+        else:
+            result = collection.update_many(query, update)
+            print(f"  - {description}: {result.modified_count} interviews updated")
+
+    print(
+        f"\nSystem prompts{' to move' if dry_run else ' moved'} to "
+        f"{config.PROMPT_REGISTRY_COLLECTION}:"
+    )
+    bytes_saved = dedupe_system_prompts(collection, dry_run)
+    print(
+        f"  {'Would save' if dry_run else 'Saved'} {bytes_saved:,} bytes of prompt text "
+        f"({bytes_saved / 2**20:.1f} MiB before compression)"
+    )
+
+    duplicates = find_duplicate_interviews(collection)
+    if duplicates:
+        print(
+            f"\n{len(duplicates)} username/start time combinations occur more than once; "
+            "remove the extra documents before the unique index can be created:"
+        )
+        for duplicate in duplicates[:20]:
+            print(
+                f"  - {duplicate['_id'].get('username')} at "
+                f"{duplicate['_id'].get('start_time_unix')} ({duplicate['count']} documents)"
+            )
+        if len(duplicates) > 20:
+            print(f"  ... and {len(duplicates) - 20} more")
+
+    if not dry_run:
+        database.ensure_indexes(collection)
+        print(f"\nIndexes: {', '.join(sorted(collection.index_information()))}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="One-off migration normalizing the fields of stored interviews "
+        "(numeric durations, message counts, BSON dates), moving their system prompts "
+        "to the prompt registry and creating the indexes.",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only report how many interviews would be updated",
+    )
+    args = parser.parse_args()
+
+    migrate_interviews(dry_run=args.dry_run)
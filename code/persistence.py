@@ -0,0 +1,369 @@
+import atexit
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from pymongo import UpdateOne
+
+import config
+import database
+from metrics import export_turn_metrics
+from utils import (
+    build_interview_update,
+    get_persisted_message_count,
+    get_persisted_turn_count,
+    get_prompt_reference,
+    set_persisted_message_count,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class PersistenceWorker:
+    """Background writer for interview backups (write-behind).
+
+    The Streamlit script thread only hands over snapshots (see
+    utils.snapshot_interview); disk and database writes happen on a worker thread.
+    Pending snapshots are coalesced per (username, start_time_unix), so only the
+    newest state of an interview is written, and flushed to MongoDB in batches.
+    Failed writes are retried with capped exponential backoff unless a newer
+    snapshot of the same interview has arrived in the meantime. Snapshots that
+    could not be written by the time the worker shuts down are spilled to a
+    dead-letter file for recovery. The writes of a finished interview are
+    cancelled before its final save (see cancel).
+    """
+
+    def __init__(
+        self,
+        max_pending=config.PERSISTENCE_MAX_PENDING,
+        batch_size=config.PERSISTENCE_BATCH_SIZE,
+        max_backoff=config.PERSISTENCE_MAX_BACKOFF_SECONDS,
+        dead_letter_path=config.PERSISTENCE_DEAD_LETTER_FILE,
+    ):
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.max_backoff = max_backoff
+        self.dead_letter_path = dead_letter_path
+
+        self._pending = OrderedDict()
+        # Keys of the snapshots being written, and of cancelled interviews whose
+        # snapshots must not be queued again
+        self._in_flight = set()
+        self._cancelled = set()
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread = threading.Thread(
+            target=self._run, name="interview-persistence", daemon=True
+        )
+        self._thread.start()
+
+    def submit(
+        self,
+        snapshot,
+        mongo_secrets,
+        backup_writer,
+        backup_options,
+        timers=(),
+        session_writer=None,
+    ):
+        """Queue a snapshot for writing; replaces a pending one of the same interview.
+
+        session_writer, if given, is called without arguments to store the session
+        of the interview in the session store. The durations of the writes are
+        recorded in the given metrics.TurnTimer objects (also those of replaced
+        snapshots), which are then exported. Blocks while the queue is full, which
+        bounds memory if storage falls behind.
+        """
+        key = (snapshot["username"], snapshot["start_time"])
+        item = {
+            "snapshot": snapshot,
+            "mongo_secrets": mongo_secrets,
+            "backup_writer": backup_writer,
+            "backup_options": backup_options,
+            "session_writer": session_writer,
+            "timers": list(timers),
+            "attempts": 0,
+            "not_before": 0.0,
+        }
+        with self._condition:
+            while (
+                key not in self._pending
+                and len(self._pending) >= self.max_pending
+                and not self._stopping
+            ):
+                self._condition.wait()
+            if key in self._pending:
+                item["timers"] = self._pending[key]["timers"] + item["timers"]
+            self._cancelled.discard(key)
+            self._pending[key] = item
+            self._condition.notify_all()
+
+    def cancel(self, key, timeout=None):
+        """Drop the queued snapshot of an interview, identified by (username,
+        start_time_unix), and wait until one being written is done, so that no
+        older state can overwrite a final save that follows.
+
+        Writes of other interviews are not waited for. Returns False if a write
+        of the interview was still in progress after timeout seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        dropped = []
+        with self._condition:
+            self._cancelled.add(key)
+            while True:
+                item = self._pending.pop(key, None)
+                if item is not None:
+                    dropped.append(item)
+                    self._condition.notify_all()
+                if key not in self._in_flight:
+                    self._cancelled.discard(key)
+                    cancelled = True
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    # Stays cancelled, so a failed write is not retried later
+                    cancelled = False
+                    break
+                self._condition.wait(remaining)
+
+        # The turns of dropped snapshots are reported without write durations
+        for item in dropped:
+            for timer in item["timers"]:
+                try:
+                    export_turn_metrics(timer.metrics)
+                except Exception:
+                    logger.exception("Exporting turn metrics failed")
+        return cancelled
+
+    def flush(self, timeout=None):
+        """Wait until all submitted snapshots have been written; returns True on success."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._pending or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def shutdown(self, timeout=config.PERSISTENCE_SHUTDOWN_TIMEOUT_SECONDS):
+        """Drain the queue, stop the worker and spill anything left to the dead-letter file."""
+        drained = self.flush(timeout)
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        if not drained:
+            self._spill()
+
+    def _take_batch(self):
+        """Block until snapshots are due and take up to batch_size of them."""
+        with self._condition:
+            while True:
+                if self._stopping:
+                    return None
+                now = time.monotonic()
+                due = [key for key, item in self._pending.items() if item["not_before"] <= now]
+                if due:
+                    batch = [(key, self._pending.pop(key)) for key in due[: self.batch_size]]
+                    self._in_flight.update(key for key, item in batch)
+                    self._condition.notify_all()
+                    return batch
+                if self._pending:
+                    wait = min(item["not_before"] for item in self._pending.values()) - now
+                    self._condition.wait(max(wait, 0.01))
+                else:
+                    self._condition.wait()
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            try:
+                failed = self._write_batch(batch)
+            except Exception:
+                # Never let an unexpected error stop the worker; retry the batch
+                logger.exception("Writing a batch of interview snapshots failed")
+                failed = batch
+            with self._condition:
+                for key, item in failed:
+                    # A newer snapshot of the same interview supersedes the failed
+                    # one, and a cancelled interview is not retried
+                    if key in self._cancelled:
+                        continue
+                    newer = self._pending.get(key)
+                    if newer is not None:
+                        newer["timers"] = item["timers"] + newer["timers"]
+                    else:
+                        item["attempts"] += 1
+                        backoff = min(2 ** item["attempts"] * 0.1, self.max_backoff)
+                        item["not_before"] = time.monotonic() + backoff
+                        self._pending[key] = item
+                self._in_flight.difference_update(key for key, item in batch)
+                self._condition.notify_all()
+
+    def _write_batch(self, batch):
+        """Write a batch of snapshots; returns the (key, item) pairs that failed."""
+        failed = {}
+        durations = {key: {} for key, item in batch}
+
+        # Backup files, one write per interview
+        for key, item in batch:
+            started = time.perf_counter()
+            try:
+                item["backup_writer"](item["snapshot"], **item["backup_options"])
+                durations[key]["backup"] = time.perf_counter() - started
+            except Exception:
+                logger.exception("Writing the backup of %s failed", key[0])
+                failed[key] = item
+
+        # Session store, one write per interview
+        for key, item in batch:
+            if item["session_writer"] is None:
+                continue
+            started = time.perf_counter()
+            try:
+                item["session_writer"]()
+                durations[key]["session"] = time.perf_counter() - started
+            except Exception:
+                logger.exception("Storing the session of %s failed", key[0])
+                failed[key] = item
+
+        # MongoDB, one bulk write per database collection
+        by_collection = {}
+        for key, item in batch:
+            secrets = item["mongo_secrets"]
+            if secrets is None:
+                continue
+            target = (secrets["uri"], secrets["db"], secrets["collection"])
+            by_collection.setdefault(target, []).append((key, item))
+
+        for (uri, db, collection_name), items in by_collection.items():
+            started = time.perf_counter()
+            try:
+                collection = database.get_collection(
+                    {"uri": uri, "db": db, "collection": collection_name}
+                )
+                self._bulk_write(collection, [item["snapshot"] for key, item in items])
+                for key, item in items:
+                    durations[key]["database"] = time.perf_counter() - started
+            except Exception:
+                logger.exception("Writing interviews to MongoDB failed")
+                failed.update(items)
+
+        # Timings of the turns whose snapshots are now stored completely
+        for key, item in batch:
+            if key not in failed:
+                for timer in item["timers"]:
+                    for step, seconds in durations[key].items():
+                        timer.record_write(step, seconds)
+                    # The turn is stored; a failing metrics export must not retry it
+                    try:
+                        export_turn_metrics(timer.metrics)
+                    except Exception:
+                        logger.exception("Exporting turn metrics failed")
+
+        return list(failed.items())
+
+    def _bulk_write(self, collection, snapshots):
+        """Write snapshots to one collection with as few round trips as possible."""
+        prompt_references = [
+            get_prompt_reference(collection, snapshot) for snapshot in snapshots
+        ]
+        updates = [
+            build_interview_update(
+                snapshot,
+                get_persisted_message_count(snapshot),
+                reference,
+                get_persisted_turn_count(snapshot),
+            )
+            for snapshot, reference in zip(snapshots, prompt_references)
+        ]
+        result = collection.bulk_write(
+            [UpdateOne(query, update, upsert=upsert) for query, update, upsert in updates],
+            ordered=False,
+        )
+
+        # An incremental update matched nothing because the stored transcript
+        # diverged; rewrite only those interviews completely. Applied updates have
+        # left the snapshot's save time on their document
+        if result.matched_count + result.upserted_count < len(updates):
+            incremental = [i for i, (query, update, upsert) in enumerate(updates) if not upsert]
+            stored = {
+                (document["username"], document["start_time_unix"]): document.get(
+                    "last_updated_unix"
+                )
+                for document in collection.find(
+                    {
+                        "$or": [
+                            {
+                                "username": snapshots[i]["username"],
+                                "start_time_unix": snapshots[i]["start_time"],
+                            }
+                            for i in incremental
+                        ]
+                    },
+                    {"username": 1, "start_time_unix": 1, "last_updated_unix": 1, "_id": 0},
+                )
+            }
+            rewrites = []
+            for i in incremental:
+                snapshot = snapshots[i]
+                key = (snapshot["username"], snapshot["start_time"])
+                if stored.get(key) == snapshot["saved_at"]:
+                    continue
+                updates[i] = build_interview_update(snapshot, 0, prompt_references[i])
+                query, update, upsert = updates[i]
+                rewrites.append(UpdateOne(query, update, upsert=upsert))
+            if rewrites:
+                collection.bulk_write(rewrites, ordered=False)
+
+        for snapshot, (query, update, upsert) in zip(snapshots, updates):
+            set_persisted_message_count(snapshot, update)
+
+    def _spill(self):
+        """Append unwritten snapshots to the dead-letter file (one JSON object per line)."""
+        with self._condition:
+            items = list(self._pending.values())
+            self._pending.clear()
+        if not items:
+            return
+        try:
+            with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                for item in items:
+                    f.write(json.dumps(item["snapshot"]) + "\n")
+        except OSError:
+            pass
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_worker():
+    """Return the process-wide persistence worker, starting it on first use."""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = PersistenceWorker()
+            atexit.register(_worker.shutdown)
+    return _worker
+
+
+def submit_interview_data(
+    snapshot, mongo_secrets, backup_writer, timers=(), session_writer=None, **backup_options
+):
+    """Queue an interview snapshot for writing to backups, the session store and
+    MongoDB.
+
+    backup_writer is called as backup_writer(snapshot, **backup_options), e.g.
+    utils.write_interview_files or journal.append_to_journal, and session_writer
+    (if given) without arguments. The write durations are recorded in the
+    metrics.TurnTimer objects in timers.
+    """
+    get_worker().submit(
+        snapshot, mongo_secrets, backup_writer, backup_options, timers, session_writer
+    )
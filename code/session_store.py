@@ -0,0 +1,144 @@
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+import config
+import database
+
+
+# Session state of an interview in progress that a store keeps, next to its key
+# (username, start_time_unix). Everything else in the session (e.g. the displayed
+# messages) is derived from these.
+SESSION_FIELDS = [
+    "interview_config",
+    "start_time_file_names",
+    "messages",
+    "interview_active",
+    "conversation_state",
+    "turn_metrics",
+    "finalize_status",
+]
+
+
+class SessionStore:
+    """Interface of the stores that keep interview sessions outside of the server
+    process, so that any worker can resume a session.
+
+    A store is created once per process and shared by all sessions. Sessions are
+    dicts with the SESSION_FIELDS, identified by username and start_time_unix.
+    """
+
+    def save(self, username, start_time_unix, session):
+        """Create or replace the stored state of a session."""
+        raise NotImplementedError
+
+    def load(self, username, start_time_unix):
+        """Return the stored state of a session, or None if it is unknown or expired."""
+        raise NotImplementedError
+
+
+class SQLiteSessionStore(SessionStore):
+    """SQLite database file, shared by the workers of one machine."""
+
+    def __init__(self, path):
+        self.path = path
+        # sqlite3 connections must not be shared between threads
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS sessions (
+                    username TEXT NOT NULL,
+                    start_time_unix REAL NOT NULL,
+                    session TEXT NOT NULL,
+                    updated_unix REAL NOT NULL,
+                    PRIMARY KEY (username, start_time_unix)
+                )"""
+            )
+            if config.SESSION_STORE_EXPIRE_AFTER_SECONDS:
+                connection.execute(
+                    "DELETE FROM sessions WHERE updated_unix < ?",
+                    (time.time() - config.SESSION_STORE_EXPIRE_AFTER_SECONDS,),
+                )
+
+    def _connect(self):
+        """Return this thread's connection to the database file."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            # Readers do not block the writers of other workers
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def save(self, username, start_time_unix, session):
+        with self._connect() as connection:
+            connection.execute(
+                """INSERT INTO sessions (username, start_time_unix, session, updated_unix)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (username, start_time_unix)
+                DO UPDATE SET session = excluded.session, updated_unix = excluded.updated_unix""",
+                (username, start_time_unix, json.dumps(session), time.time()),
+            )
+
+    def load(self, username, start_time_unix):
+        row = (
+            self._connect()
+            .execute(
+                "SELECT session, updated_unix FROM sessions "
+                "WHERE username = ? AND start_time_unix = ?",
+                (username, start_time_unix),
+            )
+            .fetchone()
+        )
+        if row is None or (
+            config.SESSION_STORE_EXPIRE_AFTER_SECONDS
+            and row[1] < time.time() - config.SESSION_STORE_EXPIRE_AFTER_SECONDS
+        ):
+            return None
+        return json.loads(row[0])
+
+
+class MongoSessionStore(SessionStore):
+    """Collection in the interviews' MongoDB database, for workers on several machines."""
+
+    def __init__(self, mongo_secrets):
+        self.collection = database.get_collection(mongo_secrets).database[
+            config.SESSION_STORE_COLLECTION
+        ]
+        self.collection.create_index(
+            [("username", 1), ("start_time_unix", 1)], unique=True
+        )
+        if config.SESSION_STORE_EXPIRE_AFTER_SECONDS:
+            # Expired sessions are removed by the server
+            self.collection.create_index(
+                "updated",
+                expireAfterSeconds=config.SESSION_STORE_EXPIRE_AFTER_SECONDS,
+            )
+
+    def save(self, username, start_time_unix, session):
+        self.collection.update_one(
+            {"username": username, "start_time_unix": start_time_unix},
+            {"$set": {"session": session, "updated": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+
+    def load(self, username, start_time_unix):
+        stored = self.collection.find_one(
+            {"username": username, "start_time_unix": start_time_unix},
+            {"session": 1, "_id": 0},
+        )
+        return None if stored is None else stored["session"]
+
+
+def create_session_store(kind, mongo_secrets=None):
+    """Create the session store of a kind ("sqlite" or "mongo")."""
+
+    if kind == "sqlite":
+        return SQLiteSessionStore(config.SESSION_STORE_SQLITE_PATH)
+    if kind == "mongo":
+        if mongo_secrets is None:
+            raise ValueError("SESSION_STORE = 'mongo' requires the 'mongo' secrets.")
+        return MongoSessionStore(mongo_secrets)
+    raise ValueError(f"Unknown SESSION_STORE '{kind}'; use None, 'sqlite' or 'mongo'.")
@@ -0,0 +1,111 @@
+import copy
+import time
+from collections import deque
+
+import config
+
+
+class ClosingCodeMatcher:
+    """Detects closing codes in a streamed reply by scanning only the new text.
+
+    An Aho-Corasick automaton over all codes is fed the reply delta by delta; its
+    state carries over between deltas, so codes split across delta boundaries are
+    found as well, and each character is examined once.
+    """
+
+    def __init__(self, codes):
+        # Trie of all codes: transitions, failure links and the code ending in a state
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [None]
+        self._depth = [0]
+        for code in codes:
+            state = 0
+            for character in code:
+                if character not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(None)
+                    self._depth.append(self._depth[state] + 1)
+                    self._goto[state][character] = len(self._goto) - 1
+                state = self._goto[state][character]
+            self._output[state] = code
+
+        # Breadth-first computation of the failure links
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for character, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and character not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(character, 0)
+                if self._output[next_state] is None:
+                    self._output[next_state] = self._output[self._fail[next_state]]
+
+        self.reset()
+
+    def copy(self):
+        """Return a matcher for the same codes with its own matching state, without
+        building the automaton again (e.g. one per reply from a shared matcher)."""
+        matcher = copy.copy(self)
+        matcher.reset()
+        return matcher
+
+    def reset(self):
+        """Start matching a new reply."""
+        self._state = 0
+        self.matched = None
+
+    @property
+    def pending(self):
+        """Number of trailing characters fed so far that may begin a code."""
+        return self._depth[self._state]
+
+    def feed(self, text):
+        """Scan the next delta of the reply; returns the first code found so far, or None."""
+        if self.matched is not None:
+            return self.matched
+        goto, fail, output = self._goto, self._fail, self._output
+        state = self._state
+        for character in text:
+            while state and character not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(character, 0)
+            if output[state] is not None:
+                self.matched = output[state]
+                break
+        self._state = state
+        return self.matched
+
+
+class RenderThrottle:
+    """Decides when a streamed partial message should be re-rendered.
+
+    Rendering sends the whole partial message to the browser, so updates are
+    batched until min_interval seconds have passed or min_characters new characters
+    have arrived since the last render.
+    """
+
+    def __init__(
+        self,
+        min_interval=config.RENDER_MIN_INTERVAL_SECONDS,
+        min_characters=config.RENDER_MIN_CHARACTERS,
+    ):
+        self.min_interval = min_interval
+        self.min_characters = min_characters
+        self._last_render = float("-inf")
+        self._last_length = 0
+
+    def due(self, length):
+        """Return True (and record a render) if a message of this length should be rendered now."""
+        now = time.monotonic()
+        if (
+            now - self._last_render >= self.min_interval
+            or length - self._last_length >= self.min_characters
+        ):
+            self._last_render = now
+            self._last_length = length
+            return True
+        return False
@@ -2,7 +2,12 @@ import streamlit as st
 import hmac
 import time
 import os
-from pymongo import MongoClient
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pymongo import WriteConcern
+import config
+import database
 
 
 # Password screen for dashboard (note: only very basic authentication!)
@@ -60,93 +65,372 @@ def check_if_interview_completed(directory, username):
         return False
 
 
-def save_interview_data(
-    username,
+def snapshot_interview(username, system_prompt):
+    """Copy the interview state needed for saving, so that it can also be written
+    later or from a background thread without access to the session state."""
+
+    return {
+        "username": username,
+        "system_prompt": system_prompt,
+        "messages": [dict(message) for message in st.session_state.messages],
+        "start_time": st.session_state.start_time,
+        "interview_active": st.session_state.get("interview_active", True),
+        "turn_metrics": [dict(metrics) for metrics in st.session_state.get("turn_metrics", [])],
+        "conversation_state": dict(st.session_state.get("conversation_state", {})),
+        "saved_at": time.time(),
+    }
+
+
+@contextmanager
+def open_for_rewrite(path, atomic=False):
+    """Open a file for rewriting. With atomic=True, the content goes to a temporary
+    file that replaces the original only once it is completely written to disk, so
+    the file never exists in a partially written state."""
+
+    if not atomic:
+        with open(path, "w") as f:
+            yield f
+        return
+
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as f:
+        yield f
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_path, path)
+
+
+def write_interview_files(
+    snapshot,
     transcripts_directory,
     times_directory,
     file_name_addition_transcript="",
     file_name_addition_time="",
+    atomic=False,
 ):
-    """Write interview data (transcript and time) to disk."""
+    """Write an interview snapshot (transcript and time) to disk."""
+
+    username = snapshot["username"]
 
     # Store chat transcript
-    with open(
+    with open_for_rewrite(
         os.path.join(
             transcripts_directory, f"{username}{file_name_addition_transcript}.txt"
         ),
-        "w",
+        atomic,
     ) as t:
-        for message in st.session_state.messages:
+        for message in snapshot["messages"]:
             t.write(f"{message['role']}: {message['content']}\n")
 
     # Store file with start time and duration of interview
-    with open(
+    with open_for_rewrite(
         os.path.join(times_directory, f"{username}{file_name_addition_time}.txt"),
-        "w",
+        atomic,
     ) as d:
-        duration = (time.time() - st.session_state.start_time) / 60
+        duration = (snapshot["saved_at"] - snapshot["start_time"]) / 60
         d.write(
-            f"Start time (UTC): {time.strftime('%d/%m/%Y %H:%M:%S', time.localtime(st.session_state.start_time))}\nInterview duration (minutes): {duration:.2f}"
+            f"Start time (UTC): {time.strftime('%d/%m/%Y %H:%M:%S', time.localtime(snapshot['start_time']))}\nInterview duration (minutes): {duration:.2f}"
         )
 
 
-def save_interview_data_mongodb(username, system_prompt):
-    """Write or update interview data in MongoDB."""
+def save_interview_data(
+    username,
+    transcripts_directory,
+    times_directory,
+    file_name_addition_transcript="",
+    file_name_addition_time="",
+):
+    """Write interview data (transcript and time) to disk."""
 
+    write_interview_files(
+        snapshot_interview(username, None),
+        transcripts_directory,
+        times_directory,
+        file_name_addition_transcript,
+        file_name_addition_time,
+    )
+
+
+# Numbers of transcript messages and turn metrics known to be stored in MongoDB for
+# each interview (username, start_time_unix) in this process, used for incremental
+# updates
+_persisted_message_counts = {}
+_persisted_message_counts_lock = threading.Lock()
+
+
+def get_prompt_reference(collection, snapshot):
+    """Register the snapshot's system prompt and return the fields referencing it,
+    or None to store the full prompt (registry disabled or not writable)."""
+
+    if not config.PROMPT_REGISTRY or snapshot.get("system_prompt") is None:
+        return None
     try:
-        # Get MongoDB credentials from Streamlit secrets
-        mongo_uri = st.secrets["mongo"]["uri"]
-        mongo_db = st.secrets["mongo"]["db"]
-        mongo_collection = st.secrets["mongo"]["collection"]
-
-        # Connect to MongoDB
-        client = MongoClient(mongo_uri)
-        db = client[mongo_db]
-        collection = db[mongo_collection]
-
-        # Prepare transcript, excluding system message
-        transcript_list = []
-        for message in st.session_state.messages:
-            if message["role"] != "system":
-                transcript_list.append({"role": message["role"], "content": message["content"]})
-
-        # Prepare data for MongoDB
-        interview_data = {
-            "last_updated_unix": time.time(),
-            "last_updated_utc": time.strftime('%d/%m/%Y %H:%M:%S', time.localtime(time.time())),
-            "transcript": transcript_list,
-        }
+        prompt_hash, version = database.register_prompt(collection, snapshot["system_prompt"])
+    except Exception:
+        return None
+    return {"system_prompt_hash": prompt_hash, "system_prompt_version": version}
 
-        # If interview is inactive, add end time and duration
-        if not st.session_state.get("interview_active", True):
-            end_time = time.time()
-            duration = (end_time - st.session_state.start_time) / 60
-            interview_data["end_time_unix"] = end_time
-            interview_data["end_time_utc"] = time.strftime('%d/%m/%Y %H:%M:%S', time.localtime(end_time))
-            interview_data["duration_minutes"] = f"{duration:.2f}"
-
-        # Use the unique combination of username and start_time as the filter for the document
-        query = {
-            "username": username,
-            "start_time_unix": st.session_state.start_time
-        }
 
-        # Use $set to update fields, and $setOnInsert to set values only on creation
+def build_interview_update(
+    snapshot, persisted_count=0, prompt_reference=None, persisted_turns=0
+):
+    """Build the MongoDB filter and update document for an interview snapshot.
+
+    If persisted_count messages are already stored, only the newer messages are
+    appended with $push, and of the turn metrics only those of the newer turns
+    and of the last stored turn (whose write timings are recorded after it was
+    written) are set, given persisted_turns stored turns. The filter then also
+    requires the stored message_count to equal persisted_count, so a repeated or
+    out-of-order update matches nothing instead of duplicating messages. A new
+    document references the system prompt with prompt_reference (see
+    get_prompt_reference) or, without one, stores the full prompt. Returns
+    (query, update, upsert).
+    """
+
+    # Prepare transcript, excluding system message
+    transcript_list = []
+    for message in snapshot["messages"]:
+        if message["role"] != "system":
+            transcript_list.append({"role": message["role"], "content": message["content"]})
+
+    # Prepare data for MongoDB
+    saved_at = snapshot["saved_at"]
+    interview_data = {
+        "last_updated_unix": saved_at,
+        "last_updated_utc": time.strftime('%d/%m/%Y %H:%M:%S', time.localtime(saved_at)),
+        "message_count": len(transcript_list),
+    }
+    turn_metrics = snapshot.get("turn_metrics", [])
+    if snapshot.get("conversation_state"):
+        interview_data["conversation_state"] = snapshot["conversation_state"]
+
+    # If interview is inactive, add end time and duration
+    if not snapshot["interview_active"]:
+        end_time = saved_at
+        duration = (end_time - snapshot["start_time"]) / 60
+        interview_data["end_time_unix"] = end_time
+        interview_data["end_time_utc"] = time.strftime('%d/%m/%Y %H:%M:%S', time.localtime(end_time))
+        interview_data["end_time"] = datetime.fromtimestamp(end_time, tz=timezone.utc)
+        interview_data["duration_minutes"] = round(duration, 2)
+
+    # Use the unique combination of username and start_time as the filter for the document
+    query = {
+        "username": snapshot["username"],
+        "start_time_unix": snapshot["start_time"]
+    }
+
+    # Incremental update: append new messages to the stored transcript
+    if 0 < persisted_count <= len(transcript_list):
+        query["message_count"] = persisted_count
+        for turn in range(max(persisted_turns - 1, 0), len(turn_metrics)):
+            interview_data[f"turn_metrics.{turn}"] = turn_metrics[turn]
         update = {
             "$set": interview_data,
-            "$setOnInsert": {
-                "username": username,
-                "start_time_unix": st.session_state.start_time,
-                "start_time_utc": time.strftime('%d/%m/%Y %H:%M:%S', time.localtime(st.session_state.start_time)),
-                "system_prompt": system_prompt,
-            }
+            "$push": {"transcript": {"$each": transcript_list[persisted_count:]}},
         }
+        return query, update, False
+
+    # Full rewrite: use $set to update fields, and $setOnInsert to set values only on creation
+    interview_data["transcript"] = transcript_list
+    interview_data["turn_metrics"] = turn_metrics
+    update = {
+        "$set": interview_data,
+        "$setOnInsert": {
+            "username": snapshot["username"],
+            "start_time_unix": snapshot["start_time"],
+            "start_time_utc": time.strftime('%d/%m/%Y %H:%M:%S', time.localtime(snapshot["start_time"])),
+            "start_time": datetime.fromtimestamp(snapshot["start_time"], tz=timezone.utc),
+            **(prompt_reference or {"system_prompt": snapshot["system_prompt"]}),
+        }
+    }
+
+    return query, update, True
+
+
+def get_persisted_message_count(snapshot):
+    """Return how many transcript messages of the interview are already stored."""
+
+    if not config.INCREMENTAL_TRANSCRIPT_UPDATES:
+        return 0
+    with _persisted_message_counts_lock:
+        return _persisted_message_counts.get(
+            (snapshot["username"], snapshot["start_time"]), (0, 0)
+        )[0]
 
-        # Update the document, or insert it if it doesn't exist
-        collection.update_one(query, update, upsert=True)
 
-        # Close the connection
-        client.close()
+def get_persisted_turn_count(snapshot):
+    """Return how many turn metrics of the interview are already stored."""
+
+    if not config.INCREMENTAL_TRANSCRIPT_UPDATES:
+        return 0
+    with _persisted_message_counts_lock:
+        return _persisted_message_counts.get(
+            (snapshot["username"], snapshot["start_time"]), (0, 0)
+        )[1]
+
+
+def set_persisted_message_count(snapshot, update):
+    """Record the message and turn counts written by update, or forget finished
+    interviews."""
+
+    key = (snapshot["username"], snapshot["start_time"])
+    with _persisted_message_counts_lock:
+        if snapshot["interview_active"]:
+            _persisted_message_counts[key] = (
+                update["$set"]["message_count"],
+                len(snapshot.get("turn_metrics", [])),
+            )
+        else:
+            _persisted_message_counts.pop(key, None)
+
+
+def write_interview_mongodb(collection, snapshot):
+    """Write an interview snapshot to MongoDB, incrementally where possible."""
+
+    prompt_reference = get_prompt_reference(collection, snapshot)
+    query, update, upsert = build_interview_update(
+        snapshot,
+        get_persisted_message_count(snapshot),
+        prompt_reference,
+        get_persisted_turn_count(snapshot),
+    )
+    result = collection.update_one(query, update, upsert=upsert)
+
+    # The stored transcript diverged from what this process expected (e.g. a write
+    # was lost, or the document predates message_count): rewrite it completely
+    if not upsert and result.matched_count == 0:
+        query, update, upsert = build_interview_update(snapshot, 0, prompt_reference)
+        collection.update_one(query, update, upsert=upsert)
+
+    set_persisted_message_count(snapshot, update)
+
+
+def write_final_interview_files(snapshot, transcripts_directory, times_directory):
+    """Write the final transcript and time files of an interview atomically. They
+    are named by username, which marks the interview as completed (see
+    check_if_interview_completed)."""
+    write_interview_files(snapshot, transcripts_directory, times_directory, atomic=True)
+
+
+def read_final_interview_start_time(times_directory, username):
+    """Return the start time (Unix seconds, whole) recorded in the final time file
+    of a username, or None if there is none."""
+    try:
+        with open(os.path.join(times_directory, f"{username}.txt"), "r") as d:
+            first_line = d.readline()
+    except FileNotFoundError:
+        return None
+    try:
+        return time.mktime(
+            time.strptime(
+                first_line.removeprefix("Start time (UTC): ").strip(), "%d/%m/%Y %H:%M:%S"
+            )
+        )
+    except ValueError:
+        return None
+
+
+def finalize_interview(snapshot, mongo_secrets, transcripts_directory, times_directory):
+    """Store the final transcript and time files and the final MongoDB document.
+
+    Files are written atomically and the database write must be acknowledged with
+    FINALIZE_WRITE_CONCERN. Failed steps are retried with exponential backoff for at
+    most FINALIZE_MAX_ATTEMPTS attempts. Returns a status dict for the UI with the
+    overall 'state' ("saved", "partial" or "failed"), the result of each step
+    (database_saved is None if MongoDB is not configured), the number of attempts,
+    errors and timings in seconds.
+    """
+
+    started = time.perf_counter()
+    status = {
+        "state": "failed",
+        "files_saved": False,
+        "database_saved": False if mongo_secrets is not None else None,
+        "attempts": 0,
+        "errors": [],
+        "timings": {"files_seconds": 0.0, "database_seconds": 0.0, "backoff_seconds": 0.0},
+    }
+
+    for attempt in range(1, config.FINALIZE_MAX_ATTEMPTS + 1):
+        status["attempts"] = attempt
+
+        if not status["files_saved"]:
+            step_started = time.perf_counter()
+            try:
+                write_final_interview_files(snapshot, transcripts_directory, times_directory)
+                status["files_saved"] = True
+            except OSError as e:
+                status["errors"].append(f"Attempt {attempt}, files: {e}")
+            status["timings"]["files_seconds"] += time.perf_counter() - step_started
+
+        if status["database_saved"] is False:
+            step_started = time.perf_counter()
+            try:
+                collection = database.get_collection(mongo_secrets).with_options(
+                    write_concern=WriteConcern(
+                        w=config.FINALIZE_WRITE_CONCERN,
+                        wtimeout=config.FINALIZE_WRITE_TIMEOUT_MS,
+                    )
+                )
+                write_interview_mongodb(collection, snapshot)
+                status["database_saved"] = True
+            except Exception as e:
+                status["errors"].append(f"Attempt {attempt}, database: {e}")
+            status["timings"]["database_seconds"] += time.perf_counter() - step_started
+
+        if status["files_saved"] and status["database_saved"] is not False:
+            break
+
+        if attempt < config.FINALIZE_MAX_ATTEMPTS:
+            backoff = min(
+                config.FINALIZE_INITIAL_BACKOFF_SECONDS * 2 ** (attempt - 1),
+                config.FINALIZE_MAX_BACKOFF_SECONDS,
+            )
+            time.sleep(backoff)
+            status["timings"]["backoff_seconds"] += backoff
+
+    if status["files_saved"] and status["database_saved"] is not False:
+        status["state"] = "saved"
+    elif status["files_saved"] or status["database_saved"]:
+        status["state"] = "partial"
+    status["timings"]["total_seconds"] = time.perf_counter() - started
+
+    # Keep the timings of the final save with the interview (best effort)
+    if status["database_saved"]:
+        try:
+            database.get_collection(mongo_secrets).update_one(
+                {"username": snapshot["username"], "start_time_unix": snapshot["start_time"]},
+                {"$set": {"finalize_metrics": {
+                    "attempts": status["attempts"],
+                    "files_saved": status["files_saved"],
+                    **status["timings"],
+                }}},
+            )
+        except Exception:
+            pass
+
+    return status
+
+
+def get_mongo_secrets():
+    """Return the MongoDB secrets as a plain dict, or None if they are not configured."""
+
+    try:
+        return dict(st.secrets["mongo"])
+    except Exception:
+        return None
+
+
+def save_interview_data_mongodb(username, system_prompt):
+    """Write or update interview data in MongoDB."""
+
+    try:
+        # Get the collection through the process-wide pooled client, configured
+        # with the MongoDB credentials from Streamlit secrets
+        collection = database.get_collection(st.secrets["mongo"])
+
+        # Update the document, or insert it if it doesn't exist
+        write_interview_mongodb(collection, snapshot_interview(username, system_prompt))
 
     except Exception as e:
         # In case of any error (e.g., secrets not configured), do not stop the app